@@ -0,0 +1,57 @@
+"""
+Compares the model backends (PyTorch, ONNX Runtime, OpenVINO, OpenVINO int8) on the same frames.
+
+Besides latency it reports how many detections each backend finds relative to
+PyTorch, as a quick check that an export (in particular the int8 one) did not
+lose accuracy. Exports are cached, so only the first run pays for them.
+
+Usage (from the repository root):
+    python -m benchmarks.backends --video videos/fire.mp4 --backends pytorch onnx openvino-int8
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.common import load_frames
+from core.inference_engine import configure_model_execution, load_models, run_models
+from core.model_backends import MODEL_BACKENDS
+
+
+def benchmark_backend(backend, frames, batch_size, iterations, warmup):
+    models = load_models('cpu', backend)
+    executor = configure_model_execution('cpu', "sequential")
+    batch = [frames[i % len(frames)] for i in range(batch_size)]
+    latencies = []
+    detections = 0
+    for i in range(warmup + iterations):
+        start_time = time.perf_counter()
+        results = run_models(*models, batch, executor)
+        if i >= warmup:
+            latencies.append(time.perf_counter() - start_time)
+            detections += sum(len(frame_detections) for frame_detections in results)
+    latencies.sort()
+    return statistics.mean(latencies), latencies[int(0.95 * (len(latencies) - 1))], detections / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", help="Video to take frames from. Random frames are used when omitted.")
+    parser.add_argument("--backends", nargs="+", default=list(MODEL_BACKENDS), choices=list(MODEL_BACKENDS))
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    args = parser.parse_args()
+
+    frames = load_frames(args.video, args.batch_size)
+    results = {backend: benchmark_backend(backend, frames, args.batch_size, args.iterations, args.warmup)
+               for backend in args.backends}
+
+    baseline = results.get("pytorch")
+    print(f"\n{'backend':>14} {'mean ms':>9} {'p95':>8} {'speedup':>8} {'detections':>11}")
+    for backend, (mean, p95, detections) in results.items():
+        speedup = f"{baseline[0] / mean:>7.2f}x" if baseline else f"{'-':>8}"
+        print(f"{backend:>14} {1000 * mean:>9.1f} {1000 * p95:>8.1f} {speedup} {detections:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import cv2
+import numpy as np
+
+
+def load_frames(video_path: str = None, count: int = 8, shape=(720, 1280, 3)):
+    """
+    Returns `count` frames for a benchmark, read evenly from a video when one is
+    given, otherwise random frames of the given shape.
+    """
+    if video_path:
+        cap = cv2.VideoCapture(video_path)
+        total_frames = max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), count)
+        frames = []
+        for index in np.linspace(0, total_frames - 1, count).astype(int):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(index))
+            ret, frame = cap.read()
+            if ret:
+                frames.append(frame)
+        cap.release()
+        if frames:
+            return frames
+        print(f"Could not read frames from {video_path}; using random frames.")
+
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, size=shape, dtype=np.uint8) for _ in range(count)]
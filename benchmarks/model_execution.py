@@ -0,0 +1,66 @@
+"""
+Compares sequential and parallel execution of the person, PPE and fire models.
+
+Usage (from the repository root):
+    python -m benchmarks.model_execution --video videos/fire.mp4 --batch-sizes 1 4 8
+    python -m benchmarks.model_execution --video videos/fire.mp4 --ppe-cascade skip_empty
+
+With a PPE cascade, use a video with people in it: on random frames the person
+model finds no one and the PPE model never runs.
+"""
+import argparse
+import statistics
+import time
+
+import torch
+
+import config
+from benchmarks.common import load_frames
+from core.inference_engine import configure_model_execution, load_models, run_models
+
+
+def benchmark_mode(models, frames, mode, batch_size, iterations, warmup, device):
+    executor = configure_model_execution(device, mode)
+    batch = [frames[i % len(frames)] for i in range(batch_size)]
+    latencies = []
+    try:
+        for i in range(warmup + iterations):
+            start_time = time.perf_counter()
+            run_models(*models, batch, executor)
+            if i >= warmup:
+                latencies.append(time.perf_counter() - start_time)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    latencies.sort()
+    return statistics.mean(latencies), latencies[int(0.95 * (len(latencies) - 1))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", help="Video to take frames from. Random frames are used when omitted.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--ppe-cascade", choices=["off", "skip_empty", "crops"], default=config.PPE_CASCADE_MODE,
+                        help="PPE_CASCADE_MODE to run the models with.")
+    args = parser.parse_args()
+    config.PPE_CASCADE_MODE = args.ppe_cascade
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    models = load_models(device)
+    frames = load_frames(args.video, max(args.batch_sizes))
+
+    print(f"\nPPE cascade: {config.PPE_CASCADE_MODE}")
+    print(f"{'batch':>5} {'sequential ms':>14} {'p95':>8} {'parallel ms':>12} {'p95':>8} {'speedup':>8}")
+    for batch_size in args.batch_sizes:
+        seq_mean, seq_p95 = benchmark_mode(models, frames, "sequential", batch_size, args.iterations, args.warmup,
+                                           device)
+        par_mean, par_p95 = benchmark_mode(models, frames, "parallel", batch_size, args.iterations, args.warmup,
+                                           device)
+        print(f"{batch_size:>5} {1000 * seq_mean:>14.1f} {1000 * seq_p95:>8.1f} {1000 * par_mean:>12.1f} "
+              f"{1000 * par_p95:>8.1f} {seq_mean / par_mean:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
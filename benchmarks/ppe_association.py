@@ -0,0 +1,91 @@
+"""
+Compares the per-person Python loop that used to match persons to PPE items with
+the vectorized PPEAssociator, on synthetic crowded scenes.
+
+The loop is reproduced here as the reference; the benchmark checks that both
+produce the same violations before timing them.
+
+Usage (from the repository root):
+    python -m benchmarks.ppe_association --persons 10 50 100 --items 40 200 400
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from core.detections import ClassTable, Detections
+from core.ppe_association import PPEAssociator
+
+CLASS_NAMES = ["person", "helmet", "vest", "goggles", "no-helmet", "no-vest", "fire", "smoke"]
+REQUIRED_PPE = {"helmet", "vest"}
+
+
+def random_boxes(rng, count, width=1920, height=1080, min_size=20, max_size=200):
+    sizes = rng.uniform(min_size, max_size, size=(count, 2))
+    corners = rng.uniform(0, 1, size=(count, 2)) * ([width, height] - sizes)
+    return np.hstack([corners, corners + sizes]).astype(np.float32)
+
+
+def make_scene(rng, persons, items, class_table):
+    person_boxes = random_boxes(rng, persons, min_size=60, max_size=400)
+    ppe_ids = np.flatnonzero(class_table.is_ppe)
+    data = np.zeros((items, 6), dtype=np.float32)
+    data[:, :4] = random_boxes(rng, items)
+    data[:, 4] = rng.uniform(0.1, 1.0, size=items)
+    data[:, 5] = rng.choice(ppe_ids, size=items)
+    return person_boxes, Detections(data)
+
+
+def loop_violations(person_boxes, ppe_items, class_table):
+    """The original double loop of the logic engine."""
+    ppe_item_names = [class_table.names[class_id] for class_id in ppe_items.class_ids]
+    results = []
+    for person_bbox in person_boxes:
+        detected_ppe_for_person, explicit_violations = set(), set()
+        px1, py1, px2, py2 = person_bbox
+        for item_bbox, item_name in zip(ppe_items.boxes, ppe_item_names):
+            ix1, iy1, ix2, iy2 = item_bbox
+            if not (px2 < ix1 or px1 > ix2 or py2 < iy1 or py1 > iy2):
+                if item_name.startswith("no-"):
+                    explicit_violations.add(item_name)
+                else:
+                    detected_ppe_for_person.add(item_name)
+        missing_ppe = REQUIRED_PPE - detected_ppe_for_person
+        results.append(explicit_violations.union({f"missing-{item}" for item in missing_ppe}))
+    return results
+
+
+def time_call(fn, iterations):
+    latencies = []
+    for _ in range(iterations):
+        start_time = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start_time)
+    return statistics.mean(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--persons", type=int, nargs="+", default=[10, 50, 100])
+    parser.add_argument("--items", type=int, nargs="+", default=[40, 200, 400])
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    class_table = ClassTable(CLASS_NAMES)
+    associator = PPEAssociator(class_table, REQUIRED_PPE)
+
+    print(f"\n{'persons':>7} {'items':>6} {'loop ms':>9} {'vectorized ms':>14} {'speedup':>8}")
+    for persons, items in zip(args.persons, args.items):
+        person_boxes, ppe_items = make_scene(rng, persons, items, class_table)
+        expected = loop_violations(person_boxes, ppe_items, class_table)
+        assert associator.violations(person_boxes, ppe_items) == expected, "Vectorized result differs from the loop"
+        loop_time = time_call(lambda: loop_violations(person_boxes, ppe_items, class_table), args.iterations)
+        vectorized_time = time_call(lambda: associator.violations(person_boxes, ppe_items), args.iterations)
+        print(f"{persons:>7} {items:>6} {1000 * loop_time:>9.2f} {1000 * vectorized_time:>14.3f} "
+              f"{loop_time / vectorized_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
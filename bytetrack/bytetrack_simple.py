@@ -1,55 +1,46 @@
 """
-Simplified ByteTrack implementation for person tracking
+ByteTrack implementation for person tracking
+Kalman motion model, two-stage association and lost-track re-activation
 No external dependencies required
 """
 
 import numpy as np
-from collections import defaultdict
-
-
-class SimpleTrack:
-    """Simple track object"""
-    track_id_counter = 0
-
-    def __init__(self, bbox, score):
-        self.track_id = SimpleTrack.track_id_counter
-        SimpleTrack.track_id_counter += 1
-        self.bbox = bbox  # [x1, y1, x2, y2]
-        self.score = score
-        self.age = 0
-        self.hits = 1
-        self.time_since_update = 0
-        self.is_activated = True
-
-    def update(self, bbox, score):
-        """Update track with new detection"""
-        self.bbox = bbox
-        self.score = score
-        self.hits += 1
-        self.time_since_update = 0
-
-    def mark_missed(self):
-        """Mark track as missed in current frame"""
-        self.time_since_update += 1
-        if self.time_since_update > 30:  # Remove after 30 frames
-            self.is_activated = False
-
-    @property
-    def tlbr(self):
-        """Get bbox in [x1, y1, x2, y2] format"""
-        return np.array(self.bbox)
+from bytetrack.matching import iou_matrix, linear_assignment
+from bytetrack.track_store import TrackState, TrackStore
 
 
 class SimpleBYTETracker:
-    """Simplified BYTE tracker implementation"""
+    """BYTE tracker
 
-    def __init__(self, track_thresh=0.5, track_buffer=60, match_thresh=0.8):
+    Each frame the Kalman states of the tracked and lost tracks are predicted,
+    then associated with the detections in two stages: first the high score
+    detections (IoU fused with detection score), then the remaining tracked
+    tracks with the low score detections, which keeps people alive through
+    occlusions where the detector is unsure. Lost tracks that match again are
+    re-activated with their old ID; they are dropped after track_buffer frames.
+    New tracks need to be matched on a second frame before they are reported.
+
+    Tracks live in a TrackStore (one array row per track), and every step works
+    on arrays of row indices.
+    """
+
+    def __init__(self, track_thresh=0.5, track_buffer=60, match_thresh=0.8, low_thresh=0.1):
+        """
+        Args:
+            track_thresh: score splitting high from low score detections
+            track_buffer: frames a lost track is kept for re-activation
+            match_thresh: largest 1 - IoU (fused with score) of a first-stage match
+            low_thresh: detections below this score are ignored
+        """
         self.track_thresh = track_thresh
         self.track_buffer = track_buffer
         self.match_thresh = match_thresh
-        self.tracks = []
-        self.lost_tracks = []
+        self.low_thresh = low_thresh
+        self.det_thresh = track_thresh + 0.1
+        self.store = TrackStore()
         self.frame_id = 0
+        self.counters = {"created": 0, "reactivated": 0, "lost": 0, "removed": 0}
+        self.removed_track_ids = np.empty(0, dtype=np.int64)  # tracks that ended in the last update()
 
     def update(self, detections, img_shape):
         """Update tracker with new detections
@@ -59,110 +50,78 @@ class SimpleBYTETracker:
             img_shape: tuple of (height, width)
 
         Returns:
-            list of active tracks
+            ActiveTracks with the track_ids and boxes of the active tracks;
+            the IDs of tracks removed by this update are in removed_track_ids
         """
         self.frame_id += 1
-
-        if len(detections) == 0:
-            # Mark all tracks as missed
-            for track in self.tracks:
-                track.mark_missed()
-            # Remove dead tracks
-            self.tracks = [t for t in self.tracks if t.is_activated]
-            return []
-
-        # Split detections by score
-        high_detections = []
-        low_detections = []
-
-        for det in detections:
-            if det[4] >= self.track_thresh:
-                high_detections.append(det)
-            else:
-                low_detections.append(det)
-
-        # Match high score detections with existing tracks
-        matched_tracks = []
-        unmatched_dets = list(range(len(high_detections)))
-        unmatched_tracks = list(range(len(self.tracks)))
-
-        if len(self.tracks) > 0 and len(high_detections) > 0:
-            # Calculate IoU matrix
-            iou_matrix = self._calculate_iou_matrix(
-                [t.bbox for t in self.tracks],
-                [d[:4] for d in high_detections]
-            )
-
-            # Match using Hungarian algorithm (simplified greedy matching)
-            for track_idx in range(len(self.tracks)):
-                if track_idx not in unmatched_tracks:
-                    continue
-
-                best_match = -1
-                best_iou = self.match_thresh
-
-                for det_idx in unmatched_dets:
-                    if iou_matrix[track_idx, det_idx] > best_iou:
-                        best_iou = iou_matrix[track_idx, det_idx]
-                        best_match = det_idx
-
-                if best_match >= 0:
-                    # Update matched track
-                    self.tracks[track_idx].update(
-                        high_detections[best_match][:4],
-                        high_detections[best_match][4]
-                    )
-                    matched_tracks.append(track_idx)
-                    unmatched_dets.remove(best_match)
-                    unmatched_tracks.remove(track_idx)
-
-        # Create new tracks for unmatched high score detections
-        for det_idx in unmatched_dets:
-            det = high_detections[det_idx]
-            new_track = SimpleTrack(det[:4], det[4])
-            self.tracks.append(new_track)
-
-        # Mark unmatched tracks as missed
-        for track_idx in unmatched_tracks:
-            self.tracks[track_idx].mark_missed()
-
-        # Remove dead tracks
-        self.tracks = [t for t in self.tracks if t.is_activated]
-
-        return self.tracks
+        store = self.store
+        detections = np.asarray(detections, dtype=np.float64).reshape(-1, 5)
+        scores = detections[:, 4]
+        high_detections = detections[scores >= self.track_thresh]
+        low_detections = detections[(scores > self.low_thresh) & (scores < self.track_thresh)]
+
+        tracked = store.rows_in_state(TrackState.Tracked)
+        unconfirmed = tracked[~store.is_activated[tracked]]
+        pool = np.concatenate([tracked[store.is_activated[tracked]], store.rows_in_state(TrackState.Lost)])
+        store.predict(pool)
+
+        # First association: all confirmed and lost tracks with the high score detections
+        dists = self._iou_distance(pool, high_detections, fuse_score=True)
+        matches, u_track, u_detection = linear_assignment(dists, self.match_thresh)
+        self.counters["reactivated"] += store.update(pool[matches[:, 0]], high_detections[matches[:, 1]],
+                                                     self.frame_id)
+
+        # Second association: tracks still being tracked with the low score detections
+        remaining = pool[u_track]
+        remaining = remaining[store.state[remaining] == TrackState.Tracked]
+        dists = self._iou_distance(remaining, low_detections)
+        matches, u_remaining, _ = linear_assignment(dists, 0.5)
+        store.update(remaining[matches[:, 0]], low_detections[matches[:, 1]], self.frame_id)
+        store.state[remaining[u_remaining]] = TrackState.Lost
+        self.counters["lost"] += len(u_remaining)
+
+        # New tracks from the last frame get their confirming match from the leftovers
+        high_detections = high_detections[u_detection]
+        dists = self._iou_distance(unconfirmed, high_detections, fuse_score=True)
+        matches, u_unconfirmed, u_detection = linear_assignment(dists, 0.7)
+        store.update(unconfirmed[matches[:, 0]], high_detections[matches[:, 1]], self.frame_id)
+        removed = [store.remove(unconfirmed[u_unconfirmed])]
+
+        # Start new tracks from confident unmatched detections
+        new_detections = high_detections[u_detection]
+        new_detections = new_detections[new_detections[:, 4] >= self.det_thresh]
+        store.add(new_detections, self.frame_id, activated=self.frame_id == 1)
+        self.counters["created"] += len(new_detections)
+
+        lost = store.rows_in_state(TrackState.Lost)
+        expired = lost[self.frame_id - store.frame_id[lost] > self.track_buffer]
+        removed.append(store.remove(expired))
+        self.counters["removed"] += len(expired)
+        removed.append(self._remove_duplicates())
+        self.removed_track_ids = np.concatenate(removed)
+
+        return store.active()
+
+    def _remove_duplicates(self):
+        """Drop the younger of a tracked and a lost track covering the same person. Returns their IDs."""
+        store = self.store
+        tracked = store.rows_in_state(TrackState.Tracked)
+        lost = store.rows_in_state(TrackState.Lost)
+        if not len(tracked) or not len(lost):
+            return np.empty(0, dtype=np.int64)
+        p, q = np.nonzero(self._calculate_iou_matrix(store.tlbr(tracked), store.tlbr(lost)) > 0.85)
+        tracked_age = store.frame_id[tracked[p]] - store.start_frame[tracked[p]]
+        lost_age = store.frame_id[lost[q]] - store.start_frame[lost[q]]
+        duplicates = np.where(tracked_age > lost_age, lost[q], tracked[p])
+        return store.remove(np.unique(duplicates))
+
+    def _iou_distance(self, rows, detections, fuse_score=False):
+        """1 - IoU between track predictions and detections, optionally weighted by detection score"""
+        ious = self._calculate_iou_matrix(self.store.tlbr(rows), detections[:, :4])
+        if fuse_score and ious.size:
+            ious = ious * detections[None, :, 4]
+        return 1.0 - ious
 
     def _calculate_iou_matrix(self, bboxes1, bboxes2):
         """Calculate IoU matrix between two sets of bboxes"""
-        n1 = len(bboxes1)
-        n2 = len(bboxes2)
-        iou_matrix = np.zeros((n1, n2))
-
-        for i, bbox1 in enumerate(bboxes1):
-            for j, bbox2 in enumerate(bboxes2):
-                iou_matrix[i, j] = self._calculate_iou(bbox1, bbox2)
-
-        return iou_matrix
-
-    def _calculate_iou(self, bbox1, bbox2):
-        """Calculate IoU between two bboxes"""
-        # Get intersection
-        x1 = max(bbox1[0], bbox2[0])
-        y1 = max(bbox1[1], bbox2[1])
-        x2 = min(bbox1[2], bbox2[2])
-        y2 = min(bbox1[3], bbox2[3])
-
-        if x2 < x1 or y2 < y1:
-            return 0.0
-
-        intersection = (x2 - x1) * (y2 - y1)
-
-        # Get areas
-        area1 = (bbox1[2] - bbox1[0]) * (bbox1[3] - bbox1[1])
-        area2 = (bbox2[2] - bbox2[0]) * (bbox2[3] - bbox2[1])
-
-        # Calculate IoU
-        union = area1 + area2 - intersection
-        if union <= 0:
-            return 0.0
-
-        return intersection / union
\ No newline at end of file
+        return iou_matrix(bboxes1, bboxes2)
@@ -0,0 +1,89 @@
+"""
+Batched Kalman filter for ByteTrack
+Works on the states of many tracks at once, no per-track Python loop
+"""
+
+import numpy as np
+
+
+class KalmanFilter:
+    """Constant velocity Kalman filter in (cx, cy, aspect, h) box space
+
+    The 8-dimensional state is [cx, cy, a, h, vx, vy, va, vh]. Every method takes
+    and returns stacked arrays: means of shape (N, 8) and covariances of shape
+    (N, 8, 8), so one call handles all tracks of a frame.
+    """
+
+    std_weight_position = 1.0 / 20
+    std_weight_velocity = 1.0 / 160
+
+    def __init__(self):
+        ndim = 4
+        self._motion_mat = np.eye(2 * ndim)
+        for i in range(ndim):
+            self._motion_mat[i, ndim + i] = 1.0
+        self._update_mat = np.eye(ndim, 2 * ndim)
+
+    def initiate(self, measurements):
+        """Create track states from unassociated (N, 4) xyah measurements"""
+        measurements = np.asarray(measurements, dtype=np.float64).reshape(-1, 4)
+        mean = np.hstack([measurements, np.zeros_like(measurements)])
+        h = measurements[:, 3]
+        std = np.stack([
+            2 * self.std_weight_position * h,
+            2 * self.std_weight_position * h,
+            np.full_like(h, 1e-2),
+            2 * self.std_weight_position * h,
+            10 * self.std_weight_velocity * h,
+            10 * self.std_weight_velocity * h,
+            np.full_like(h, 1e-5),
+            10 * self.std_weight_velocity * h,
+        ], axis=1)
+        return mean, self._diag(std ** 2)
+
+    def predict(self, mean, covariance):
+        """Advance all states by one frame"""
+        h = mean[:, 3]
+        std = np.stack([
+            self.std_weight_position * h,
+            self.std_weight_position * h,
+            np.full_like(h, 1e-2),
+            self.std_weight_position * h,
+            self.std_weight_velocity * h,
+            self.std_weight_velocity * h,
+            np.full_like(h, 1e-5),
+            self.std_weight_velocity * h,
+        ], axis=1)
+        mean = mean @ self._motion_mat.T
+        covariance = self._motion_mat @ covariance @ self._motion_mat.T + self._diag(std ** 2)
+        return mean, covariance
+
+    def project(self, mean, covariance):
+        """Project states to measurement space"""
+        h = mean[:, 3]
+        std = np.stack([
+            self.std_weight_position * h,
+            self.std_weight_position * h,
+            np.full_like(h, 1e-1),
+            self.std_weight_position * h,
+        ], axis=1)
+        mean = mean @ self._update_mat.T
+        covariance = self._update_mat @ covariance @ self._update_mat.T + self._diag(std ** 2)
+        return mean, covariance
+
+    def update(self, mean, covariance, measurements):
+        """Correct the states with their associated (N, 4) xyah measurements"""
+        projected_mean, projected_cov = self.project(mean, covariance)
+        # K = P H^T S^-1, solved as S K^T = H P since P and S are symmetric
+        kalman_gain = np.linalg.solve(projected_cov, self._update_mat @ covariance).transpose(0, 2, 1)
+        innovation = np.asarray(measurements, dtype=np.float64) - projected_mean
+        new_mean = mean + (kalman_gain @ innovation[:, :, None])[:, :, 0]
+        new_covariance = covariance - kalman_gain @ projected_cov @ kalman_gain.transpose(0, 2, 1)
+        return new_mean, new_covariance
+
+    @staticmethod
+    def _diag(values):
+        n, d = values.shape
+        out = np.zeros((n, d, d))
+        out[:, np.arange(d), np.arange(d)] = values
+        return out
@@ -0,0 +1,136 @@
+"""
+IoU and linear assignment helpers for the tracker
+NumPy only, no lap/scipy dependency
+"""
+
+import numpy as np
+
+# Cost given to pairs that must not be matched. Large enough that the solver
+# only uses such a pair when no feasible alternative exists; it is filtered out afterwards.
+_INFEASIBLE_COST = 1e6
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """IoU between every box of boxes_a (N, 4) and boxes_b (M, 4), as an (N, M) array"""
+    boxes_a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)))
+
+    a = boxes_a[:, None, :]
+    b = boxes_b[None, :, :]
+    inter_w = np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0])
+    inter_h = np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1])
+    intersection = np.where((inter_w >= 0) & (inter_h >= 0), inter_w * inter_h, 0.0)
+
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(union > 0, intersection / union, 0.0)
+
+
+def _shortest_augmenting_path(cost):
+    """Minimum cost assignment of every row of an (n, m) matrix with n <= m.
+
+    Jonker-Volgenant style shortest augmenting paths with row/column potentials
+    (the O(n^2 m) Hungarian method), with the inner scan over columns vectorized.
+
+    Returns:
+        array of length n with the column assigned to each row
+    """
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    row_of_col = np.zeros(m + 1, dtype=np.int64)  # 1-based row per column, 0 = free
+    way = np.zeros(m + 1, dtype=np.int64)
+
+    for row in range(1, n + 1):
+        row_of_col[0] = row
+        col = 0
+        min_slack = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[col] = True
+            current_row = row_of_col[col]
+            free = ~used[1:]
+            slack = cost[current_row - 1] - u[current_row] - v[1:]
+            improved = free & (slack < min_slack[1:])
+            min_slack[1:][improved] = slack[improved]
+            way[1:][improved] = col
+
+            candidates = np.where(free, min_slack[1:], np.inf)
+            next_col = int(np.argmin(candidates)) + 1
+            delta = candidates[next_col - 1]
+
+            used_cols = np.flatnonzero(used)
+            u[row_of_col[used_cols]] += delta
+            v[used_cols] -= delta
+            min_slack[1:][free] -= delta
+
+            col = next_col
+            if row_of_col[col] == 0:
+                break
+
+        while col:
+            previous_col = way[col]
+            row_of_col[col] = row_of_col[previous_col]
+            col = previous_col
+
+    col_of_row = np.empty(n, dtype=np.int64)
+    assigned_cols = np.flatnonzero(row_of_col[1:])
+    col_of_row[row_of_col[assigned_cols + 1] - 1] = assigned_cols
+    return col_of_row
+
+
+def linear_assignment(cost_matrix, thresh):
+    """Optimal one-to-one matching of rows to columns
+
+    Pairs with a cost above thresh are never matched.
+
+    Args:
+        cost_matrix: (N, M) array of matching costs
+        thresh: largest cost a matched pair may have
+
+    Returns:
+        matches: (K, 2) array of [row, col] pairs
+        unmatched_rows: array of unmatched row indices
+        unmatched_cols: array of unmatched column indices
+    """
+    cost_matrix = np.asarray(cost_matrix, dtype=np.float64)
+    n, m = cost_matrix.shape
+    if n == 0 or m == 0:
+        return np.empty((0, 2), dtype=np.int64), np.arange(n), np.arange(m)
+
+    feasible = cost_matrix <= thresh
+    row_options = feasible.sum(axis=1)
+    col_options = feasible.sum(axis=0)
+
+    # Pairs that are each other's only option match directly, which in practice
+    # covers most of a scene; the solver only sees rows and columns still contested.
+    sole_rows = np.flatnonzero(row_options == 1)
+    sole_cols = feasible[sole_rows].argmax(axis=1)
+    sole = col_options[sole_cols] == 1
+    direct = np.stack([sole_rows[sole], sole_cols[sole]], axis=1)
+
+    contested_rows = np.flatnonzero(row_options > 0)
+    contested_cols = np.flatnonzero(col_options > 0)
+    contested_rows = np.setdiff1d(contested_rows, direct[:, 0])
+    contested_cols = np.setdiff1d(contested_cols, direct[:, 1])
+    matches = [direct]
+    if len(contested_rows) and len(contested_cols):
+        sub_feasible = feasible[np.ix_(contested_rows, contested_cols)]
+        cost = np.where(sub_feasible, cost_matrix[np.ix_(contested_rows, contested_cols)], _INFEASIBLE_COST)
+        if len(contested_rows) <= len(contested_cols):
+            rows = np.arange(len(contested_rows))
+            cols = _shortest_augmenting_path(cost)
+        else:
+            cols = np.arange(len(contested_cols))
+            rows = _shortest_augmenting_path(cost.T)
+        keep = sub_feasible[rows, cols]
+        matches.append(np.stack([contested_rows[rows[keep]], contested_cols[cols[keep]]], axis=1))
+
+    matches = np.concatenate(matches).astype(np.int64)
+    unmatched_rows = np.setdiff1d(np.arange(n), matches[:, 0])
+    unmatched_cols = np.setdiff1d(np.arange(m), matches[:, 1])
+    return matches, unmatched_rows, unmatched_cols
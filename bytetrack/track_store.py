@@ -0,0 +1,162 @@
+"""
+Struct-of-arrays storage for tracks
+Preallocated arrays with a free-list of rows instead of one Python object per track
+"""
+
+import numpy as np
+from bytetrack.kalman_filter import KalmanFilter
+
+
+class TrackState:
+    Free = -1
+    New = 0
+    Tracked = 1
+    Lost = 2
+
+
+class ActiveTracks:
+    """The tracks reported for a frame, as parallel arrays"""
+    __slots__ = ("track_ids", "boxes")
+
+    def __init__(self, track_ids, boxes):
+        self.track_ids = track_ids  # (N,) int64
+        self.boxes = boxes  # (N, 4) [x1, y1, x2, y2]
+
+    def __len__(self):
+        return len(self.track_ids)
+
+
+class TrackStore:
+    """All tracks of one tracker in preallocated arrays, one row per track
+
+    Rows are handed out from a free-list and returned to it when a track is
+    removed; the arrays double in size only when every row is taken. Kalman
+    states are kept in float32 and promoted to float64 only while the filter
+    runs. Track IDs are unique for the whole process, like before, so a reused
+    row never carries another person's identity.
+    """
+
+    track_id_counter = 0
+    kalman = KalmanFilter()
+
+    def __init__(self, capacity=64):
+        self.capacity = 0
+        self.mean = np.zeros((0, 8), dtype=np.float32)
+        self.covariance = np.zeros((0, 8, 8), dtype=np.float32)
+        self.score = np.zeros(0, dtype=np.float32)
+        self.track_id = np.zeros(0, dtype=np.int64)
+        self.state = np.zeros(0, dtype=np.int8)
+        self.is_activated = np.zeros(0, dtype=bool)
+        self.tracklet_len = np.zeros(0, dtype=np.int32)
+        self.start_frame = np.zeros(0, dtype=np.int32)
+        self.frame_id = np.zeros(0, dtype=np.int32)
+        self._free_rows = []
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        extra = capacity - self.capacity
+        self.mean = np.concatenate([self.mean, np.zeros((extra, 8), dtype=np.float32)])
+        self.covariance = np.concatenate([self.covariance, np.zeros((extra, 8, 8), dtype=np.float32)])
+        self.score = np.concatenate([self.score, np.zeros(extra, dtype=np.float32)])
+        self.track_id = np.concatenate([self.track_id, np.zeros(extra, dtype=np.int64)])
+        self.state = np.concatenate([self.state, np.full(extra, TrackState.Free, dtype=np.int8)])
+        self.is_activated = np.concatenate([self.is_activated, np.zeros(extra, dtype=bool)])
+        self.tracklet_len = np.concatenate([self.tracklet_len, np.zeros(extra, dtype=np.int32)])
+        self.start_frame = np.concatenate([self.start_frame, np.zeros(extra, dtype=np.int32)])
+        self.frame_id = np.concatenate([self.frame_id, np.zeros(extra, dtype=np.int32)])
+        # Hand out low rows first
+        self._free_rows = list(range(capacity - 1, self.capacity - 1, -1)) + self._free_rows
+        self.capacity = capacity
+
+    def __len__(self):
+        return self.capacity - len(self._free_rows)
+
+    @staticmethod
+    def tlbr_to_xyah(tlbr):
+        tlbr = np.asarray(tlbr, dtype=np.float64).reshape(-1, 4)
+        w = tlbr[:, 2] - tlbr[:, 0]
+        h = np.maximum(tlbr[:, 3] - tlbr[:, 1], 1e-6)
+        return np.stack([tlbr[:, 0] + w / 2, tlbr[:, 1] + h / 2, w / h, h], axis=1)
+
+    def rows_in_state(self, state):
+        return np.flatnonzero(self.state == state)
+
+    def tlbr(self, rows):
+        """Boxes [x1, y1, x2, y2] of the given rows from their Kalman means"""
+        cx, cy, a, h = self.mean[rows, :4].astype(np.float64).T
+        w = a * h
+        return np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+    def add(self, detections, frame_id, activated):
+        """Start tracks from (K, 5) [x1, y1, x2, y2, score] detections. Returns their rows."""
+        if len(detections) > len(self._free_rows):
+            self._grow(max(2 * self.capacity, len(self) + len(detections)))
+        rows = np.array([self._free_rows.pop() for _ in range(len(detections))], dtype=np.int64)
+        if not len(rows):
+            return rows
+        mean, covariance = self.kalman.initiate(self.tlbr_to_xyah(detections[:, :4]))
+        self.mean[rows] = mean
+        self.covariance[rows] = covariance
+        self.score[rows] = detections[:, 4]
+        self.track_id[rows] = np.arange(TrackStore.track_id_counter + 1,
+                                        TrackStore.track_id_counter + 1 + len(rows))
+        TrackStore.track_id_counter += len(rows)
+        self.state[rows] = TrackState.Tracked
+        self.is_activated[rows] = activated
+        self.tracklet_len[rows] = 0
+        self.start_frame[rows] = frame_id
+        self.frame_id[rows] = frame_id
+        return rows
+
+    def remove(self, rows):
+        """Free the given rows. Returns the track IDs they held."""
+        track_ids = self.track_id[rows]
+        self.state[rows] = TrackState.Free
+        self.is_activated[rows] = False
+        self._free_rows.extend(int(row) for row in rows)
+        return track_ids
+
+    def predict(self, rows):
+        """Advance the Kalman states of the given rows by one frame"""
+        if not len(rows):
+            return
+        mean = self.mean[rows].astype(np.float64)
+        # A track that is not being tracked keeps its size
+        mean[self.state[rows] != TrackState.Tracked, 7] = 0
+        mean, covariance = self.kalman.predict(mean, self.covariance[rows].astype(np.float64))
+        self.mean[rows] = mean
+        self.covariance[rows] = covariance
+
+    def update(self, rows, detections, frame_id):
+        """Correct the given rows with their matched detections; lost ones are re-activated
+
+        Returns:
+            number of re-activated tracks
+        """
+        if not len(rows):
+            return 0
+        mean, covariance = self.kalman.update(self.mean[rows].astype(np.float64),
+                                              self.covariance[rows].astype(np.float64),
+                                              self.tlbr_to_xyah(detections[:, :4]))
+        self.mean[rows] = mean
+        self.covariance[rows] = covariance
+        was_tracked = self.state[rows] == TrackState.Tracked
+        self.tracklet_len[rows] = np.where(was_tracked, self.tracklet_len[rows] + 1, 0)
+        self.state[rows] = TrackState.Tracked
+        self.is_activated[rows] = True
+        self.score[rows] = detections[:, 4]
+        self.frame_id[rows] = frame_id
+        return int((~was_tracked).sum())
+
+    def active(self):
+        """Tracked and activated tracks"""
+        rows = np.flatnonzero((self.state == TrackState.Tracked) & self.is_activated)
+        return ActiveTracks(self.track_id[rows], self.tlbr(rows))
+
+    def bytes_per_track(self):
+        arrays = (self.mean, self.covariance, self.score, self.track_id, self.state, self.is_activated,
+                  self.tracklet_len, self.start_frame, self.frame_id)
+        return sum(array.itemsize * int(np.prod(array.shape[1:])) for array in arrays)
+
+    def nbytes(self):
+        return self.capacity * self.bytes_per_track()
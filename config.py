@@ -5,20 +5,94 @@ CAMERA_FEEDS = {
     2: r"videos\Helmet Googles Jacket No Boots No Gloves (1).mp4"
 }
 TARGET_FPS = 10
+# "grab" only decodes the frames that will be analyzed (cv2 grab()/retrieve());
+# "read" decodes every frame of the source.
+FRAME_SAMPLING_MODE = "grab"
+# For uploaded files, seek straight to the next sampled frame when at least this many
+# frames lie between two samples. Set to 0 to always grab through the skipped frames.
+SEEK_SAMPLING_MIN_STRIDE = 15
+# How often worker processes print their counters.
+STATS_LOG_INTERVAL_SECONDS = 30
+
+# --- Motion Gate Settings ---
+# Sampled frames with no significant change against the scene background skip
+# inference; the logic engine then treats them as unchanged from the previous frame.
+MOTION_GATE_ENABLED = True
+MOTION_GATE_WIDTH = 160  # Width of the grayscale thumbnail the gate compares.
+MOTION_GATE_PIXEL_THRESHOLD = 25  # Per-pixel intensity change counted as motion.
+MOTION_GATE_MIN_CHANGED_FRACTION = 0.005  # Fraction of changed pixels that admits a frame.
+MOTION_GATE_MAX_SKIP_FRAMES = 20  # Admit a keyframe after this many suppressed samples.
+MOTION_GATE_LEARNING_RATE = 0.05  # How fast the background absorbs slow changes.
 
 # --- Queue Settings ---
-FRAME_QUEUE_SIZE = 50
+# Pending frames kept per camera. When a live camera's mailbox is full the oldest frame
+# is dropped, so a camera never lags more than this many frames behind.
+CAMERA_MAILBOX_DEPTH = 2
+# How long the inference engine sleeps when every mailbox is empty.
+MAILBOX_POLL_INTERVAL_SECONDS = 0.005
+# A batch input handler waiting for a free frame slot or mailbox space gives up (and exits
+# with an error) after this long without progress: the engines downstream are gone.
+INPUT_STALL_TIMEOUT_SECONDS = 120
+
+# --- Shared Frame Buffer Settings ---
+# Number of shared-memory frame slots per camera. This bounds the frames of a camera
+# that can be in flight between the input handler and the logic engine at once.
+FRAME_BUFFER_SLOTS = 8
+# Largest frame (height, width, channels) a slot can hold. Bigger frames are downscaled.
+FRAME_SLOT_SHAPE = (1080, 1920, 3)
 
 # --- AI Model Settings ---
 PERSON_MODEL_PATH = "yolov8n.pt"
 PPE_MODEL_PATH = "models/ppe_detection.pt"
 FIRE_MODEL_PATH = "models/best_fire_40epochs.pt"
-INFERENCE_BATCH_SIZE = 4
+# Runtime the three models are executed with: "pytorch" runs the .pt weights; "onnx",
+# "openvino" and "openvino-int8" export them once to an optimized CPU format.
+MODEL_BACKEND = "pytorch"
+# Exported artifacts are cached here, keyed by a hash of the weights they came from.
+MODEL_EXPORT_CACHE_DIR = "models/exported"
+# Dataset YAML with calibration images for int8 exports. None uses Ultralytics' default.
+MODEL_INT8_CALIBRATION_DATA = None
+# Run every model once on a blank input at startup so the first real frame is not slowed
+# down by lazy initialization.
+MODEL_WARMUP = True
+INFERENCE_BATCH_SIZE = 4  # Maximum frames per inference batch; the batcher adapts below it.
+# Longest time the batcher waits after the first frame of a batch for more frames.
+BATCH_MAX_WAIT_SECONDS = 0.05
 CONF_THRESHOLD = 0.1
 IOU_THRESHOLD = 0.2
+# Per-model schedule: each model runs on every `every_n_frames`-th analyzed frame of a
+# camera, at input size `imgsz` and confidence threshold `conf`. Between evaluations the
+# logic engine carries a model's last detections forward.
+MODEL_POLICIES = {
+    "person": {"every_n_frames": 1, "imgsz": 640, "conf": CONF_THRESHOLD},
+    "ppe": {"every_n_frames": 1, "imgsz": 640, "conf": CONF_THRESHOLD},
+    "fire": {"every_n_frames": 5, "imgsz": 480, "conf": CONF_THRESHOLD},
+}
+# "sequential" runs the person, PPE and fire models one after another on each batch;
+# "parallel" runs them concurrently on separate threads with a split CPU thread budget.
+MODEL_EXECUTION_MODE = "parallel"
+# CPU threads available to the models. 0 uses every core.
+INFERENCE_THREADS = 0
+# Number of inference processes. Each camera is owned by one of them and the CPU threads
+# above are split between them.
+INFERENCE_WORKERS = 1
+
+# --- PPE Cascade Settings ---
+# "off" runs the PPE model on every frame. "skip_empty" runs it only on frames where the
+# person model found someone. "crops" runs it on padded person crops, batched at a smaller
+# input size, and maps the boxes back to frame coordinates.
+PPE_CASCADE_MODE = "skip_empty"
+PPE_CROP_PADDING = 0.15  # Padding added on every side of a person box, as a fraction of its size.
+PPE_CROP_IMGSZ = 320
+PPE_CROP_MERGE_IOU = 0.6  # IoU above which PPE boxes from overlapping crops are merged.
 
 # --- Face Recognition Settings ---
-# Paths to your .npy files
+# Memory-mapped face gallery shared by all face workers; manage it with
+# `python -m src.face_recognition.app.database` (enroll, remove, compact, info).
+FACE_GALLERY_DIR = "data/gallery"
+# Face workers check the gallery for a new version this often and swap it in without a restart.
+FACE_GALLERY_RELOAD_SECONDS = 5
+# Paths to your .npy files, imported into the gallery when it does not exist yet
 FACE_EMBEDDINGS_PATH = "data/embeddings.npy"
 # ❗ UPDATED: Added a specific path for your names file.
 FACE_NAMES_PATH = "data/n.npy"
@@ -26,12 +100,70 @@ FACE_NAMES_PATH = "data/n.npy"
 # The similarity score required to consider a face a match.
 # ❗ UPDATED: Lowered threshold to a more reasonable value for ArcFace.
 FACE_RECOGNITION_THRESHOLD = 0.7
+# Face recognition runs in this many worker processes, off the logic engine's loop.
+FACE_RECOGNITION_WORKERS = 1
+# A worker takes up to this many waiting crops at once and matches their faces in one matrix product.
+FACE_RECOGNITION_BATCH_SIZE = 4
+# Crops waiting for a worker beyond this are dropped and retried on a later frame.
+FACE_REQUEST_QUEUE_SIZE = 32
+# A track whose request got no reply within this time may be submitted again.
+FACE_REQUEST_TIMEOUT_SECONDS = 10
+# Only person boxes at least this large (width, height) in pixels are tried.
+FACE_MIN_PERSON_SIZE = (40, 80)
+# Top fraction of the person box searched for a face.
+FACE_HEAD_REGION_FRACTION = 0.35
+# After a failed attempt a track waits this long, doubling per failure up to the maximum.
+FACE_RETRY_BASE_SECONDS = 0.5
+FACE_RETRY_MAX_SECONDS = 8
+# Attempts per track before it stays "Unknown".
+FACE_MAX_ATTEMPTS_PER_TRACK = 8
+# Galleries with at least this many embeddings are searched through an approximate
+# IVF-PQ index instead of against every embedding (0 always searches exactly).
+# See `python -m benchmarks.face_matching` for the recall/latency trade-off.
+FACE_ANN_MIN_GALLERY_SIZE = 20000
+FACE_ANN_LISTS = None  # Inverted lists; None uses about sqrt(gallery size).
+FACE_ANN_PROBES = 16  # Lists scanned per face; more is slower but finds the true best match more often.
+FACE_ANN_SUBVECTORS = 32  # Product-quantizer chunks per embedding; must divide its size (512 for ArcFace).
+FACE_ANN_RERANK = 32  # Best index candidates compared exactly.
+# A new gallery version reuses the trained index; rows enrolled since are compared exactly.
+# The index is retrained in the background after a compaction, or once the rows it does not
+# cover (enrolled since, or removed since) exceed this fraction of the rows it holds.
+FACE_ANN_REBUILD_FRACTION = 0.1
 
 # --- Logic Engine Settings ---
+# Number of logic processes. Each camera is owned by one of them (its tracker and person
+# states live there); their alerts are merged into one stream.
+LOGIC_WORKERS = 1
 VIOLATION_CONFIRM_FRAMES = 3
 ALERT_COOLDOWN_SECONDS = 10
+# Person states (name, violation counter, cooldowns) a logic engine keeps at most;
+# beyond this the least recently seen person's state is evicted.
+MAX_TRACK_STATES = 5000
+
+# --- Environmental Alert Settings ---
+# Fire/smoke boxes within this fraction of their width/height of each other belong to one incident.
+ENV_MERGE_MARGIN = 0.5
+# An incident is reported ("open") once detected on ENV_CONFIRM_HITS of the last ENV_CONFIRM_WINDOW frames
+# the fire model ran on (see MODEL_POLICIES["fire"]); frames it skipped do not count.
+ENV_CONFIRM_HITS = 3
+ENV_CONFIRM_WINDOW = 5
+# An open incident is reported closed after this many analyzed frames without detections.
+ENV_CLOSE_AFTER_FRAMES = 30
+# A camera reports at most one "update" of its open incidents per this many seconds.
+ENV_UPDATE_INTERVAL_SECONDS = 10
 
 # --- ByteTrack Settings ---
-TRACK_THRESH = 0.5
-TRACK_BUFFER = 60
-MATCH_THRESH = 0.8
+TRACK_THRESH = 0.5  # Detections at or above this score start and extend tracks; lower ones only extend.
+TRACK_BUFFER = 60  # Analyzed frames a lost track is kept for re-activation with its old ID.
+MATCH_THRESH = 0.8  # Largest (1 - IoU x score) of a match between a track and a high score detection.
+
+# --- Pipeline Service Settings ---
+# The API keeps one long-lived inference and logic pipeline with this many stream slots
+# (a mailbox and a frame buffer each). Every uploaded video occupies one slot until it
+# has been analyzed; jobs that do not fit wait in a queue.
+SERVICE_STREAM_SLOTS = 4
+# Jobs waiting for free slots beyond this are rejected with 503.
+SERVICE_MAX_QUEUED_JOBS = 16
+# Jobs interrupted by a crashed inference or logic worker are reported "failed"; this many of
+# them are remembered for status queries.
+SERVICE_FAILED_JOBS_KEPT = 1000
@@ -0,0 +1,134 @@
+import math
+import time
+from collections import Counter
+import config
+from core.mailbox import collect_round_robin
+
+
+class DynamicBatcher:
+    """
+    Builds inference batches from the camera mailboxes with a size and deadline policy.
+
+    A batch is dispatched as soon as it reaches the current target size, or when
+    the deadline after its first item expires; a batch of markers only is
+    dispatched at once, as there is nothing to batch. The target size adapts to
+    load: it is the number of frames expected to arrive while one batch is being
+    processed (arrival rate x measured batch latency), raised to the maximum
+    when the mailboxes already hold a backlog. The arrival rate is measured from
+    the mailboxes' put counters, i.e. how fast the input handlers deliver frames,
+    not how fast batches happen to be dispatched. Under light load this
+    gives small, immediate batches; under heavy load full batches. The deadline
+    is a fraction of the measured batch latency, capped by `max_wait`, so waiting
+    for more frames never costs more than running the model would.
+    """
+
+    # Weight of the newest sample in the moving averages.
+    SMOOTHING = 0.2
+    # Fraction of the measured batch latency the batcher may wait for more frames.
+    WAIT_FRACTION = 0.5
+
+    def __init__(self, mailboxes: dict, max_batch_size: int = config.INFERENCE_BATCH_SIZE,
+                 max_wait: float = config.BATCH_MAX_WAIT_SECONDS, is_frame=None):
+        self.mailboxes = mailboxes
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.is_frame = is_frame
+        self.target_batch_size = 1
+        self.batch_latency = None
+        self.arrival_rate = 0.0
+        self._round_robin_start = 0
+        self._last_rate_time = time.time()
+        self._last_puts = self._total_puts()
+        self._markers_since_rate = 0
+
+        self.batch_size_counts = Counter()
+        self.total_wait = 0.0
+        self.total_batches = 0
+        self._last_log_time = time.time()
+
+    def _count_frames(self, items) -> int:
+        if self.is_frame is None:
+            return len(items)
+        return sum(1 for _, item in items if self.is_frame(item))
+
+    def _pending_frames(self) -> int:
+        return sum(mailbox.qsize() for mailbox in self.mailboxes.values())
+
+    def _total_puts(self) -> int:
+        return sum(mailbox.puts for mailbox in self.mailboxes.values())
+
+    def _collect(self, max_frames: int):
+        items = collect_round_robin(self.mailboxes, max_frames, self._round_robin_start, self.is_frame)
+        self._round_robin_start += 1
+        return items
+
+    def next_batch(self):
+        """
+        Returns the next batch as (camera_id, item) tuples, or an empty list if
+        nothing arrived within one poll interval.
+        """
+        target = self.max_batch_size if self._pending_frames() >= self.max_batch_size else self.target_batch_size
+        items = self._collect(target)
+        if not items:
+            time.sleep(config.MAILBOX_POLL_INTERVAL_SECONDS)
+            return []
+
+        first_item_time = time.time()
+        deadline = first_item_time + self._wait_budget()
+        frames = self._count_frames(items)
+        while 0 < frames < target and time.time() < deadline:
+            time.sleep(min(config.MAILBOX_POLL_INTERVAL_SECONDS, max(0.0, deadline - time.time())))
+            new_items = self._collect(target - frames)
+            items.extend(new_items)
+            frames += self._count_frames(new_items)
+
+        now = time.time()
+        self._markers_since_rate += len(items) - frames
+        self._update_arrival_rate(now)
+        self.batch_size_counts[frames] += 1
+        self.total_wait += now - first_item_time
+        self.total_batches += 1
+        return items
+
+    def _wait_budget(self) -> float:
+        if self.batch_latency is None:
+            return self.max_wait
+        return min(self.max_wait, self.WAIT_FRACTION * self.batch_latency)
+
+    def _update_arrival_rate(self, now: float):
+        """Frames put into the mailboxes since the last update (markers taken out) per second."""
+        elapsed = max(now - self._last_rate_time, 1e-3)
+        puts = self._total_puts()
+        rate = max(0, puts - self._last_puts - self._markers_since_rate) / elapsed
+        self._last_rate_time, self._last_puts, self._markers_since_rate = now, puts, 0
+        self.arrival_rate += self.SMOOTHING * (rate - self.arrival_rate)
+
+    def record_latency(self, batch_frames: int, seconds: float):
+        """Feeds back how long the models took on a batch, so the policy can adapt."""
+        if batch_frames == 0:
+            return
+        if self.batch_latency is None:
+            self.batch_latency = seconds
+        else:
+            self.batch_latency += self.SMOOTHING * (seconds - self.batch_latency)
+        expected_arrivals = math.ceil(self.arrival_rate * self.batch_latency)
+        self.target_batch_size = max(1, min(self.max_batch_size, expected_arrivals))
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.total_batches,
+            "batch_sizes": dict(sorted(self.batch_size_counts.items())),
+            "avg_wait_ms": 1000 * self.total_wait / max(self.total_batches, 1),
+            "batch_latency_ms": 1000 * (self.batch_latency or 0.0),
+            "arrival_rate_fps": self.arrival_rate,
+            "target_batch_size": self.target_batch_size,
+        }
+
+    def maybe_log(self):
+        now = time.time()
+        if now - self._last_log_time >= config.STATS_LOG_INTERVAL_SECONDS:
+            self._last_log_time = now
+            stats = self.stats()
+            print(f"[Inference Engine] 📊 batches={stats['batches']} sizes={stats['batch_sizes']} "
+                  f"avg_wait={stats['avg_wait_ms']:.1f}ms latency={stats['batch_latency_ms']:.1f}ms "
+                  f"arrivals={stats['arrival_rate_fps']:.1f}fps target={stats['target_batch_size']}")
@@ -0,0 +1,84 @@
+import numpy as np
+
+# Classes that raise environmental alerts rather than being treated as PPE.
+ENVIRONMENTAL_CLASSES = ("fire", "smoke")
+
+BOX = slice(0, 4)
+SCORE = 4
+CLASS_ID = 5
+
+
+class Detections:
+    """
+    All detections of one frame as a single (N, 6) float32 array.
+
+    Each row is [x1, y1, x2, y2, score, class_id], where class_id is a global id
+    into the ClassTable the inference engine sends once at startup. This is what
+    travels through the results queue instead of one dict per box.
+    """
+    __slots__ = ("data",)
+
+    def __init__(self, data: np.ndarray = None):
+        self.data = np.zeros((0, 6), dtype=np.float32) if data is None else data
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def boxes(self) -> np.ndarray:
+        return self.data[:, BOX]
+
+    @property
+    def scores(self) -> np.ndarray:
+        return self.data[:, SCORE]
+
+    @property
+    def class_ids(self) -> np.ndarray:
+        return self.data[:, CLASS_ID].astype(np.int32)
+
+    def select(self, mask: np.ndarray) -> "Detections":
+        return Detections(self.data[mask])
+
+
+class ClassTable:
+    """
+    Maps global class ids to class names, with boolean lookup arrays per role so
+    that a frame's detections can be split with array masks.
+
+    The models' class lists are concatenated in order, so a model's local class id
+    plus its offset is its global class id. `model_classes` maps each model name
+    to its [first_id, end_id) range.
+    """
+
+    def __init__(self, names, model_classes: dict = None):
+        self.names = list(names)
+        self.model_classes = dict(model_classes or {})
+        self.is_person = np.array([name == "person" for name in self.names], dtype=bool)
+        self.is_environmental = np.array([name in ENVIRONMENTAL_CLASSES for name in self.names], dtype=bool)
+        self.is_ppe = ~(self.is_person | self.is_environmental)
+        self.is_violation = np.array([name.startswith("no-") for name in self.names], dtype=bool)
+
+    @staticmethod
+    def offsets_for(models):
+        """Returns the global class id offset of each model's local class ids."""
+        offsets, total = [], 0
+        for model in models:
+            offsets.append(total)
+            total += len(model.names)
+        return offsets
+
+    def model_mask(self, model_names) -> np.ndarray:
+        """Boolean lookup array of the class ids produced by the given models."""
+        mask = np.zeros(len(self.names), dtype=bool)
+        for model_name in model_names:
+            first_id, end_id = self.model_classes[model_name]
+            mask[first_id:end_id] = True
+        return mask
+
+    @classmethod
+    def from_models(cls, models, model_names) -> "ClassTable":
+        names, model_classes = [], {}
+        for model, model_name in zip(models, model_names):
+            model_classes[model_name] = [len(names), len(names) + len(model.names)]
+            names.extend(model.names[i] for i in range(len(model.names)))
+        return cls(names, model_classes)
@@ -0,0 +1,181 @@
+import time
+import numpy as np
+import config
+from bytetrack.matching import iou_matrix
+from core.ppe_association import overlap_matrix
+
+
+def expand_boxes(boxes: np.ndarray, margin: float) -> np.ndarray:
+    """Grows every [x1, y1, x2, y2] box by `margin` times its width and height on each side."""
+    size = boxes[:, 2:4] - boxes[:, 0:2]
+    return np.hstack([boxes[:, 0:2] - margin * size, boxes[:, 2:4] + margin * size])
+
+
+def merge_boxes(boxes: np.ndarray, scores: np.ndarray, margin: float):
+    """
+    Merges boxes that overlap once grown by `margin` (directly or through a chain
+    of such boxes) into their enclosing box.
+
+    Returns:
+        tuple: (M, 4) merged boxes and the (M,) highest score within each.
+    """
+    expanded = expand_boxes(boxes, margin)
+    touching = overlap_matrix(expanded, expanded)
+    # Connected components: every box takes the smallest label among its neighbours until stable.
+    labels = np.arange(len(boxes))
+    while True:
+        new_labels = np.where(touching, labels[None, :], len(boxes)).min(axis=1)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    groups = [labels == label for label in np.unique(labels)]
+    merged = np.array([[boxes[g, 0].min(), boxes[g, 1].min(), boxes[g, 2].max(), boxes[g, 3].max()] for g in groups])
+    return merged.reshape(-1, 4), np.array([scores[g].max() for g in groups])
+
+
+class EnvironmentalIncident:
+    """One fire or smoke incident on one camera."""
+    __slots__ = ("incident_id", "alert_type", "bbox", "score", "history", "missed_frames", "is_open",
+                 "opened_at", "last_event_time")
+
+    def __init__(self, incident_id: int, alert_type: str, bbox: np.ndarray, score: float):
+        self.incident_id = incident_id
+        self.alert_type = alert_type
+        self.bbox = bbox
+        self.score = score
+        self.history = 0  # bit i set = detected i frames ago, over the confirmation window
+        self.missed_frames = 0
+        self.is_open = False
+        self.opened_at = None
+        self.last_event_time = None
+
+
+class EnvironmentalEventTracker:
+    """
+    Turns per-frame fire/smoke boxes into one open/update/close event lifecycle per incident.
+
+    On every frame the fire model ran on ("observed" frames), the boxes of each
+    hazard type are merged into clusters (boxes within ENV_MERGE_MARGIN of their
+    size of each other), and every cluster is attached to the incident of that
+    type it overlaps most once grown by the same margin, or starts a new
+    candidate incident. Other frames (fire model skipped, or motion-gated) only
+    carry old boxes forward, so they count neither as hits nor as misses; they
+    only advance the close timer.
+
+    - A candidate opens, with an "open" event, once it was detected on
+      ENV_CONFIRM_HITS of the last ENV_CONFIRM_WINDOW observed frames; a
+      candidate not detected on any observed frame of the window is discarded
+      silently.
+    - An open incident closes, with a "close" event, after ENV_CLOSE_AFTER_FRAMES
+      frames without detections, or when its camera's stream ends.
+    - While incidents are open, a camera sends at most one "update" event (the
+      current box of its least recently reported incident still being detected)
+      every ENV_UPDATE_INTERVAL_SECONDS. Open and close events are never held back.
+
+    Events are `{"type": "environmental_alert", "event", "camera_id", "incident_id",
+    "alert_type", "bbox", "score", "duration_seconds"}`. `counters` tracks the
+    events sent and the updates held back by the rate limit.
+    """
+
+    def __init__(self, merge_margin: float = config.ENV_MERGE_MARGIN, confirm_hits: int = config.ENV_CONFIRM_HITS,
+                 confirm_window: int = config.ENV_CONFIRM_WINDOW,
+                 close_after_frames: int = config.ENV_CLOSE_AFTER_FRAMES,
+                 update_interval: float = config.ENV_UPDATE_INTERVAL_SECONDS):
+        self.merge_margin = merge_margin
+        self.confirm_hits = confirm_hits
+        self.window_mask = (1 << confirm_window) - 1
+        self.close_after_frames = close_after_frames
+        self.update_interval = update_interval
+        self._incidents = {}  # camera_id -> list of incidents
+        self._last_update_times = {}
+        self._next_incident_id = 0
+        self.counters = {"opened": 0, "updates": 0, "closed": 0, "discarded": 0, "updates_held_back": 0}
+
+    def update(self, camera_id, boxes: np.ndarray, scores: np.ndarray, alert_types: list, now: float = None,
+               observed: bool = True) -> list:
+        """
+        Feeds one frame's hazard boxes of a camera. Returns the events to send.
+
+        `observed` is False when the fire model did not run on the frame; its
+        boxes are then ignored and the frame only advances the close timer.
+        """
+        now = time.time() if now is None else now
+        incidents = self._incidents.setdefault(camera_id, [])
+        alert_types = np.asarray(alert_types) if observed else np.empty(0, dtype=str)
+        detected = {}  # incident -> True, for incidents detected on this frame
+        for alert_type in np.unique(alert_types):
+            of_type = alert_types == alert_type
+            clusters, cluster_scores = merge_boxes(np.asarray(boxes)[of_type], np.asarray(scores)[of_type],
+                                                   self.merge_margin)
+            candidates = [incident for incident in incidents if incident.alert_type == alert_type]
+            affinity = np.zeros((len(clusters), len(candidates)))
+            if candidates:
+                incident_boxes = np.array([incident.bbox for incident in candidates])
+                touching = overlap_matrix(expand_boxes(clusters, self.merge_margin),
+                                          expand_boxes(incident_boxes, self.merge_margin))
+                affinity = np.where(touching, 1.0 + iou_matrix(clusters, incident_boxes), 0.0)
+            for cluster, score, cluster_affinity in zip(clusters, cluster_scores, affinity):
+                if cluster_affinity.size and cluster_affinity.max() > 0:
+                    incident = candidates[int(cluster_affinity.argmax())]
+                else:
+                    incident = EnvironmentalIncident(self._next_incident_id, str(alert_type), cluster, float(score))
+                    self._next_incident_id += 1
+                    incidents.append(incident)
+                    candidates.append(incident)
+                if incident in detected:
+                    incident.bbox = np.concatenate([np.minimum(incident.bbox[:2], cluster[:2]),
+                                                    np.maximum(incident.bbox[2:], cluster[2:])])
+                    incident.score = max(incident.score, float(score))
+                else:
+                    incident.bbox, incident.score = cluster, float(score)
+                    detected[incident] = True
+
+        events = []
+        for incident in list(incidents):
+            hit = incident in detected
+            incident.missed_frames = 0 if hit else incident.missed_frames + 1
+            if incident.is_open:
+                if incident.missed_frames >= self.close_after_frames:
+                    incidents.remove(incident)
+                    self.counters["closed"] += 1
+                    events.append(self._event("close", camera_id, incident, now))
+            elif observed:
+                incident.history = ((incident.history << 1) | hit) & self.window_mask
+                if bin(incident.history).count("1") >= self.confirm_hits:
+                    incident.is_open, incident.opened_at, incident.last_event_time = True, now, now
+                    self.counters["opened"] += 1
+                    events.append(self._event("open", camera_id, incident, now))
+                elif incident.history == 0:
+                    incidents.remove(incident)
+                    self.counters["discarded"] += 1
+
+        due = [incident for incident in incidents if incident.is_open and incident.missed_frames == 0
+               and now - incident.last_event_time >= self.update_interval]
+        if due:
+            if now - self._last_update_times.get(camera_id, float("-inf")) >= self.update_interval:
+                incident = min(due, key=lambda incident: incident.last_event_time)
+                incident.last_event_time = now
+                self._last_update_times[camera_id] = now
+                self.counters["updates"] += 1
+                events.append(self._event("update", camera_id, incident, now))
+            else:
+                self.counters["updates_held_back"] += 1
+        return events
+
+    def close_camera(self, camera_id, now: float = None) -> list:
+        """Forgets a camera, e.g. when its stream ended. Returns the close events of its open incidents."""
+        now = time.time() if now is None else now
+        self._last_update_times.pop(camera_id, None)
+        events = []
+        for incident in self._incidents.pop(camera_id, []):
+            if incident.is_open:
+                self.counters["closed"] += 1
+                events.append(self._event("close", camera_id, incident, now))
+        return events
+
+    @staticmethod
+    def _event(event: str, camera_id, incident: EnvironmentalIncident, now: float) -> dict:
+        return {"type": "environmental_alert", "event": event, "camera_id": camera_id,
+                "incident_id": incident.incident_id, "alert_type": incident.alert_type,
+                "bbox": [float(v) for v in incident.bbox], "score": round(incident.score, 3),
+                "duration_seconds": round(now - incident.opened_at, 1)}
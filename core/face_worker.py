@@ -0,0 +1,395 @@
+import os
+import threading
+import time
+from multiprocessing import Process, Queue
+from queue import Empty, Full
+import numpy as np
+import config
+from src.face_recognition.app.detector import detect_faces
+from src.face_recognition.app.database import FaceGallery
+from src.face_recognition.app.embedder import get_embedding
+from src.face_recognition.app.matcher import GalleryMatcher, IVFPQIndex
+
+
+class FaceRecognizer:
+    def __init__(self, data_dir="data"):
+        """
+        Initializes the face recognizer from the memory-mapped face gallery in FACE_GALLERY_DIR.
+        """
+        print("[Face Recognizer] Initializing...")
+        self.gallery = FaceGallery(config.FACE_GALLERY_DIR)
+        self.gallery_version = None
+        self.snapshot = None
+        self.matcher = None
+        self._index_build = None  # background thread training the next ANN index
+        self._built_index = None  # (generation, index, index_rows) it left behind
+        self._last_reload_check = time.time()
+        if self.gallery.exists():
+            self._load_gallery()
+            self._maybe_build_index()
+        else:
+            print(f"[Face Recognizer] 🔴 ERROR: No face gallery found at: {config.FACE_GALLERY_DIR}")
+
+    def maybe_reload(self):
+        """
+        Swaps in a new version of the gallery if one was committed since the last check,
+        and a newly trained ANN index once it is ready. Neither waits for an index to train.
+        """
+        now = time.time()
+        if now - self._last_reload_check < config.FACE_GALLERY_RELOAD_SECONDS:
+            return
+        self._last_reload_check = now
+        if self._index_build is not None and not self._index_build.is_alive():
+            self._index_build = None
+            if self._built_index is not None and self.snapshot is not None:
+                self.matcher = self._build_matcher(self.snapshot, self._built_index)
+        try:
+            version = self.gallery.version()
+        except Exception as e:
+            print(f"[Face Recognizer] 🔴 ERROR reading the gallery manifest: {e}")
+            return
+        if version is not None and version != self.gallery_version:
+            self._load_gallery()
+        self._maybe_build_index()
+
+    def _load_gallery(self):
+        """Maps the current gallery version; the old matcher serves until then."""
+        try:
+            snapshot = self.gallery.load()
+            self.matcher = self._build_matcher(snapshot, self._built_index)
+            self.snapshot = snapshot
+            self.gallery_version = snapshot.version
+            print(f"[Face Recognizer] ✅ Loaded gallery version {snapshot.version}: {len(snapshot)} face embeddings "
+                  f"({len(snapshot.removed)} removed).")
+        except Exception as e:
+            print(f"[Face Recognizer] 🔴 ERROR loading the gallery: {e}")
+
+    @staticmethod
+    def _uses_index(snapshot):
+        return 0 < config.FACE_ANN_MIN_GALLERY_SIZE <= len(snapshot)
+
+    @classmethod
+    def _build_matcher(cls, snapshot, built_index):
+        """
+        Matches against the mapped gallery in place. Large galleries reuse the last trained
+        ANN index if it was built over the same generation of files, rows enrolled since
+        being compared exactly; otherwise they are searched exactly until one is trained.
+        """
+        if cls._uses_index(snapshot) and built_index is not None and built_index[0] == snapshot.generation:
+            _, index, index_rows = built_index
+            return GalleryMatcher(snapshot.embeddings, snapshot.names, index, rerank=config.FACE_ANN_RERANK,
+                                  normalized=True, removed=snapshot.removed, index_rows=index_rows)
+        return GalleryMatcher(snapshot.embeddings, snapshot.names, normalized=True, removed=snapshot.removed)
+
+    def _maybe_build_index(self):
+        """Starts training a new ANN index in the background if the current one is missing or too stale."""
+        snapshot, matcher = self.snapshot, self.matcher
+        if self._index_build is not None or snapshot is None or not self._uses_index(snapshot):
+            return
+        if matcher.index is not None and \
+                matcher.stale_rows() <= config.FACE_ANN_REBUILD_FRACTION * len(matcher.index_rows):
+            return
+        self._index_build = threading.Thread(target=self._build_index, args=(snapshot,), daemon=True)
+        self._index_build.start()
+
+    def _build_index(self, snapshot):
+        """Runs on the index build thread; maybe_reload swaps the result in."""
+        try:
+            start_time = time.time()
+            index = IVFPQIndex(num_lists=config.FACE_ANN_LISTS, num_subvectors=config.FACE_ANN_SUBVECTORS,
+                               num_probes=config.FACE_ANN_PROBES)
+            matcher = GalleryMatcher(snapshot.embeddings, snapshot.names, index, normalized=True,
+                                     removed=snapshot.removed)
+            self._built_index = (snapshot.generation, index, matcher.index_rows)
+            print(f"[Face Recognizer] ✅ Built ANN index over {len(snapshot)} embeddings of gallery version "
+                  f"{snapshot.version} in {time.time() - start_time:.1f}s ({index.nbytes() / 1e6:.1f} MB).")
+        except Exception as e:
+            print(f"[Face Recognizer] 🔴 ERROR building the ANN index: {e}")
+
+    def _find_matches(self, embeddings):
+        """Finds the best match for each of the given embeddings using cosine similarity."""
+        names, similarities = self.matcher.match_batch(np.asarray(embeddings))
+        matches = []
+        for name, similarity in zip(names, similarities):
+            print(
+                f"[Face Recognizer] [DEBUG] Best similarity: {similarity:.2f} | Threshold: {config.FACE_RECOGNITION_THRESHOLD}")
+            matches.append(str(name) if similarity > config.FACE_RECOGNITION_THRESHOLD else "Unknown")
+        return matches
+
+    def recognize(self, person_crop_image):
+        """
+        Detects a face and finds the closest match from known embeddings.
+        """
+        return self.recognize_batch([person_crop_image])[0]
+
+    def recognize_batch(self, person_crop_images):
+        """
+        Detects a face in each crop, then matches all found faces against the known embeddings at once.
+        """
+        names = ["Unknown"] * len(person_crop_images)
+        if self.matcher is None:
+            return names
+
+        embeddings, found = [], []
+        for i, person_crop_image in enumerate(person_crop_images):
+            if person_crop_image is None or person_crop_image.size == 0:
+                continue
+            try:
+                faces = detect_faces(person_crop_image)
+                if faces:
+                    face_image, _ = faces[0]
+                    embeddings.append(get_embedding(face_image))
+                    found.append(i)
+            except Exception:
+                pass
+
+        if embeddings:
+            try:
+                matches = self._find_matches(embeddings)
+            except Exception as e:
+                print(f"[Face Recognizer] 🔴 ERROR matching {len(embeddings)} faces against the gallery: {e}")
+                return names
+            for i, name in zip(found, matches):
+                names[i] = name
+        return names
+
+    def warmup(self):
+        """Loads the face detector and embedder now rather than on the first person seen."""
+        start_time = time.time()
+        try:
+            blank_face = np.zeros((112, 112, 3), dtype=np.uint8)
+            detect_faces(blank_face)
+            get_embedding(blank_face)
+            print(f"[Face Recognizer] 🔥 Models warmed up in {time.time() - start_time:.1f}s.")
+        except Exception as e:
+            print(f"[Face Recognizer] 🔴 ERROR during warmup: {e}")
+
+
+def run_face_recognition(request_queue: Queue, reply_queues: list):
+    """
+    A target function for a face-recognition worker process.
+
+    Takes `{"camera_id", "track_id", "crop", "reply_to"}` requests, runs face
+    detection and embedding matching on the crop and puts
+    `{"camera_id", "track_id", "name", "seconds"}` on the reply queue of the
+    logic engine that asked, where "seconds" is the time spent recognizing.
+    Requests already waiting are taken together, up to FACE_RECOGNITION_BATCH_SIZE,
+    so their faces are matched against the gallery in one go. New gallery versions
+    are picked up between requests; ANN indexes are trained on a background thread.
+    A request that fails (e.g. a gallery whose embedding size does not match the
+    embedder's) is answered "Unknown" and logged, so the worker keeps serving.
+    Runs forever.
+    """
+    print("[Face Worker] 🟢 Starting...")
+    face_recognizer = FaceRecognizer()
+    if config.MODEL_WARMUP:
+        face_recognizer.warmup()
+    while True:
+        face_recognizer.maybe_reload()
+        try:
+            requests = [request_queue.get(timeout=config.FACE_GALLERY_RELOAD_SECONDS)]
+        except Empty:
+            continue
+        while len(requests) < config.FACE_RECOGNITION_BATCH_SIZE:
+            try:
+                requests.append(request_queue.get_nowait())
+            except Empty:
+                break
+        start_time = time.perf_counter()
+        try:
+            names = face_recognizer.recognize_batch([request["crop"] for request in requests])
+        except Exception as e:
+            print(f"[Face Worker] 🔴 ERROR recognizing {len(requests)} crops: {e}")
+            names = ["Unknown"] * len(requests)
+        seconds = (time.perf_counter() - start_time) / len(requests)
+        for request, name in zip(requests, names):
+            reply_queues[request["reply_to"]].put({"camera_id": request["camera_id"], "track_id": request["track_id"],
+                                                   "name": name, "seconds": seconds})
+
+
+def import_legacy_gallery():
+    """
+    Creates the face gallery from the FACE_EMBEDDINGS_PATH / FACE_NAMES_PATH .npy files
+    if there is no gallery yet, so existing deployments keep their enrolled faces.
+    """
+    gallery = FaceGallery(config.FACE_GALLERY_DIR)
+    if gallery.exists():
+        return
+    if not (os.path.exists(config.FACE_EMBEDDINGS_PATH) and os.path.exists(config.FACE_NAMES_PATH)):
+        return
+    try:
+        rows = gallery.enroll(np.load(config.FACE_NAMES_PATH, allow_pickle=True),
+                              np.load(config.FACE_EMBEDDINGS_PATH))
+        print(f"[Face Recognizer] ✅ Imported {len(rows)} face embeddings into the gallery at {config.FACE_GALLERY_DIR}.")
+    except Exception as e:
+        print(f"[Face Recognizer] 🔴 ERROR importing {config.FACE_EMBEDDINGS_PATH}: {e}")
+
+
+def start_face_workers(num_reply_queues: int = 1, num_workers: int = config.FACE_RECOGNITION_WORKERS):
+    """
+    Starts the face-recognition worker pool, importing the legacy .npy gallery first if needed.
+
+    Args:
+        num_reply_queues (int): One reply queue per logic engine process using the pool.
+
+    Returns:
+        tuple: (request queue, list of reply queues, list of started processes).
+    """
+    import_legacy_gallery()
+    request_queue = Queue(maxsize=config.FACE_REQUEST_QUEUE_SIZE)
+    reply_queues = [Queue() for _ in range(num_reply_queues)]
+    processes = []
+    for worker_id in range(num_workers):
+        process = Process(target=run_face_recognition, args=(request_queue, reply_queues),
+                          name=f"FaceWorker-{worker_id}")
+        process.start()
+        processes.append(process)
+    return request_queue, reply_queues, processes
+
+
+class _TrackAttempts:
+    """Recognition schedule of one track."""
+    __slots__ = ("attempts", "in_flight_since", "next_attempt_time")
+
+    def __init__(self):
+        self.attempts = 0
+        self.in_flight_since = None
+        self.next_attempt_time = 0.0
+
+
+class FaceRecognitionClient:
+    """
+    The logic engine's side of the face-recognition pool.
+
+    Every track is scheduled on its own, keyed by (camera_id, track_id):
+
+    - Only person boxes of at least FACE_MIN_PERSON_SIZE pixels (width, height)
+      are tried; smaller faces are rarely recognizable.
+    - Only the head region, the top FACE_HEAD_REGION_FRACTION of the box, is sent.
+    - At most one request per track is in flight. A request with no reply
+      within FACE_REQUEST_TIMEOUT_SECONDS is given up.
+    - After a failed attempt the track waits FACE_RETRY_BASE_SECONDS, doubling
+      after every further failure up to FACE_RETRY_MAX_SECONDS.
+    - A track gets at most FACE_MAX_ATTEMPTS_PER_TRACK attempts.
+
+    Submitting never blocks: when the pool's queue is full the crop is dropped
+    and the track is simply tried again on a later frame. Without a request
+    queue face recognition is disabled and every track stays "Unknown".
+
+    `counters` tracks attempts, hits, misses, skips by reason and the seconds
+    the workers spent in DeepFace.
+    """
+
+    def __init__(self, request_queue: Queue, reply_queue: Queue, reply_to: int = 0):
+        self.request_queue = request_queue
+        self.reply_queue = reply_queue
+        self.reply_to = reply_to
+        self._tracks = {}
+        self.counters = {"attempts": 0, "hits": 0, "misses": 0, "timeouts": 0, "skipped_small": 0,
+                         "skipped_budget": 0, "dropped_full": 0, "deepface_seconds": 0.0}
+        self._last_log_time = time.time()
+
+    def head_region(self, camera_id, track_id, bbox, frame_shape):
+        """
+        Decides whether to attempt recognition of a track now.
+
+        Returns:
+            tuple: The (x1, y1, x2, y2) head region to crop, clipped to the frame,
+                or None when the track should not be tried on this frame.
+        """
+        if self.request_queue is None:
+            return None
+        key = (camera_id, track_id)
+        track = self._tracks.get(key)
+        now = time.time()
+        if track is not None:
+            if track.in_flight_since is not None:
+                if now - track.in_flight_since <= config.FACE_REQUEST_TIMEOUT_SECONDS:
+                    return None
+                track.in_flight_since = None
+                self.counters["timeouts"] += 1
+                self._schedule_retry(track, now)
+            if now < track.next_attempt_time:
+                return None
+            if track.attempts >= config.FACE_MAX_ATTEMPTS_PER_TRACK:
+                self.counters["skipped_budget"] += 1
+                return None
+
+        frame_height, frame_width = frame_shape[:2]
+        x1, y1 = max(0, int(bbox[0])), max(0, int(bbox[1]))
+        x2, y2 = min(frame_width, int(bbox[2])), min(frame_height, int(bbox[3]))
+        min_width, min_height = config.FACE_MIN_PERSON_SIZE
+        if x2 - x1 < min_width or y2 - y1 < min_height:
+            self.counters["skipped_small"] += 1
+            return None
+        head_bottom = min(y2, int(bbox[1] + (bbox[3] - bbox[1]) * config.FACE_HEAD_REGION_FRACTION))
+        if head_bottom <= y1:
+            return None
+        return x1, y1, x2, head_bottom
+
+    def submit(self, camera_id, track_id, crop: np.ndarray) -> bool:
+        """Queues a copy of the crop for recognition. Returns False if the pool is saturated."""
+        try:
+            self.request_queue.put_nowait({"camera_id": camera_id, "track_id": track_id,
+                                           "crop": crop.copy(), "reply_to": self.reply_to})
+        except Full:
+            self.counters["dropped_full"] += 1
+            return False
+        track = self._tracks.setdefault((camera_id, track_id), _TrackAttempts())
+        track.attempts += 1
+        track.in_flight_since = time.time()
+        self.counters["attempts"] += 1
+        return True
+
+    def poll(self) -> list:
+        """
+        Returns the replies that arrived since the last call as (camera_id, track_id, name) tuples.
+
+        A name is returned for any track still scheduled, even if its request had
+        already timed out; a late "Unknown" is dropped, since the timeout already
+        scheduled the retry.
+        """
+        replies = []
+        while self.reply_queue is not None:
+            try:
+                reply = self.reply_queue.get_nowait()
+            except Empty:
+                break
+            self.counters["deepface_seconds"] += reply["seconds"]
+            track = self._tracks.get((reply["camera_id"], reply["track_id"]))
+            if track is None:
+                continue
+            if reply["name"] != "Unknown":
+                # Also a reply that arrived after its request timed out: the track needs no more attempts.
+                track.in_flight_since = None
+                self.counters["hits"] += 1
+            elif track.in_flight_since is not None:
+                track.in_flight_since = None
+                self.counters["misses"] += 1
+                self._schedule_retry(track, time.time())
+            else:
+                continue
+            replies.append((reply["camera_id"], reply["track_id"], reply["name"]))
+        return replies
+
+    @staticmethod
+    def _schedule_retry(track: _TrackAttempts, now: float):
+        delay = config.FACE_RETRY_BASE_SECONDS * 2 ** max(0, track.attempts - 1)
+        track.next_attempt_time = now + min(delay, config.FACE_RETRY_MAX_SECONDS)
+
+    def forget_tracks(self, camera_id, track_ids):
+        """Drops the schedules of tracks the camera's tracker removed."""
+        for track_id in track_ids:
+            self._tracks.pop((camera_id, track_id), None)
+
+    def forget_camera(self, camera_id):
+        """Drops the camera's track schedules, e.g. when its stream ended."""
+        for key in [key for key in self._tracks if key[0] == camera_id]:
+            del self._tracks[key]
+
+    def maybe_log(self, force: bool = False):
+        now = time.time()
+        if force or now - self._last_log_time >= config.STATS_LOG_INTERVAL_SECONDS:
+            self._last_log_time = now
+            counters = dict(self.counters, deepface_seconds=round(self.counters["deepface_seconds"], 2))
+            print(f"[Logic Engine] 📊 Face recognition: {counters}")
@@ -0,0 +1,149 @@
+import time
+from multiprocessing import Lock, shared_memory
+from typing import NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+class FrameHandle(NamedTuple):
+    """A small, picklable reference to a frame stored in a FrameRingBuffer slot."""
+    camera_id: int
+    slot: int
+    seq: int
+    shape: Tuple[int, int, int]
+
+
+def fit_frame_to_slot(frame: np.ndarray, slot_shape: Tuple[int, int, int]) -> np.ndarray:
+    """Downscales a frame (keeping its aspect ratio) if it does not fit into a slot."""
+    slot_h, slot_w = slot_shape[:2]
+    h, w = frame.shape[:2]
+    if h <= slot_h and w <= slot_w:
+        return frame
+    scale = min(slot_h / h, slot_w / w)
+    new_size = (max(1, int(w * scale)), max(1, int(h * scale)))
+    return cv2.resize(frame, new_size, interpolation=cv2.INTER_AREA)
+
+
+class FrameRingBuffer:
+    """
+    A ring of fixed-size shared-memory frame slots for a single camera.
+
+    The input handler decodes a frame directly into a free slot and only a
+    FrameHandle travels through the queues. The inference and logic engines map
+    the same memory without copying, and the logic engine releases the slot once
+    it is done with the frame so that it can be reused.
+
+    The buffer is created once by the parent process and passed to the worker
+    processes as a regular Process argument; workers attach to the same block.
+    """
+
+    def __init__(self, num_slots: int, slot_shape: Tuple[int, int, int]):
+        self.num_slots = num_slots
+        self.slot_shape = tuple(slot_shape)
+        self.slot_nbytes = int(np.prod(self.slot_shape))
+        self._data_nbytes = self.num_slots * self.slot_nbytes
+        self._shm = shared_memory.SharedMemory(create=True, size=self._data_nbytes + self.num_slots * 8)
+        self._owner = True
+        self._lock = Lock()
+        self._bind_seq_array()
+        self._slot_seqs[:] = -1
+
+    def _bind_seq_array(self):
+        # Sequence number of the frame held by each slot; -1 marks a free slot.
+        self._slot_seqs = np.ndarray((self.num_slots,), dtype=np.int64, buffer=self._shm.buf,
+                                     offset=self._data_nbytes)
+
+    def __getstate__(self):
+        return {
+            "name": self._shm.name,
+            "num_slots": self.num_slots,
+            "slot_shape": self.slot_shape,
+            "lock": self._lock,
+        }
+
+    def __setstate__(self, state):
+        self.num_slots = state["num_slots"]
+        self.slot_shape = state["slot_shape"]
+        self.slot_nbytes = int(np.prod(self.slot_shape))
+        self._data_nbytes = self.num_slots * self.slot_nbytes
+        self._shm = shared_memory.SharedMemory(name=state["name"])
+        self._owner = False
+        self._lock = state["lock"]
+        self._bind_seq_array()
+
+    def write(self, camera_id: int, seq: int, frame: np.ndarray, block: bool = False,
+              timeout: Optional[float] = None) -> Optional[FrameHandle]:
+        """
+        Copies a frame into a free slot and returns its handle.
+
+        Returns None when no slot is free, i.e. when the downstream engines still
+        hold every slot of this camera. The caller should drop the frame.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        slot = self._claim_slot(seq)
+        while slot is None and block:
+            if deadline is not None and time.time() >= deadline:
+                break
+            time.sleep(0.001)
+            slot = self._claim_slot(seq)
+        if slot is None:
+            return None
+
+        frame = fit_frame_to_slot(frame, self.slot_shape)
+        handle = FrameHandle(camera_id, slot, seq, tuple(frame.shape))
+        np.copyto(self._slot_array(handle), frame)
+        return handle
+
+    def _claim_slot(self, seq: int) -> Optional[int]:
+        with self._lock:
+            free_slots = np.flatnonzero(self._slot_seqs == -1)
+            if free_slots.size == 0:
+                return None
+            slot = int(free_slots[0])
+            self._slot_seqs[slot] = seq
+            return slot
+
+    def view(self, handle: FrameHandle) -> np.ndarray:
+        """Returns a zero-copy view of the frame referenced by the handle."""
+        return self._slot_array(handle)
+
+    def release(self, handle: FrameHandle):
+        """Returns the slot of a handle to the free list. Releasing twice is a no-op."""
+        with self._lock:
+            if self._slot_seqs[handle.slot] == handle.seq:
+                self._slot_seqs[handle.slot] = -1
+
+    def reset(self):
+        """Frees every slot, also those of handles lost with a crashed process. Only safe when no handle is in use."""
+        with self._lock:
+            self._slot_seqs[:] = -1
+
+    def free_slot_count(self) -> int:
+        return int(np.count_nonzero(self._slot_seqs == -1))
+
+    def _slot_array(self, handle: FrameHandle) -> np.ndarray:
+        return np.ndarray(handle.shape, dtype=np.uint8, buffer=self._shm.buf,
+                          offset=handle.slot * self.slot_nbytes)
+
+    def close(self):
+        """Detaches this process from the shared memory block."""
+        self._slot_seqs = None
+        self._shm.close()
+
+    def unlink(self):
+        """Frees the shared memory block. Only the creating process should call this."""
+        if self._owner:
+            self._shm.unlink()
+
+
+def create_frame_buffers(camera_ids, num_slots: int, slot_shape: Tuple[int, int, int]):
+    """Creates one FrameRingBuffer per camera id."""
+    return {camera_id: FrameRingBuffer(num_slots, slot_shape) for camera_id in camera_ids}
+
+
+def destroy_frame_buffers(frame_buffers):
+    """Closes and unlinks buffers created with create_frame_buffers."""
+    for frame_buffer in frame_buffers.values():
+        frame_buffer.close()
+        frame_buffer.unlink()
@@ -1,82 +1,392 @@
+import os
 import time
-from multiprocessing import Queue
-from ultralytics import YOLO
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing import Process, Queue, get_start_method
+import numpy as np
 import torch
+from torchvision.ops import batched_nms
 import config
+from core.input_handler import END_OF_STREAM, FRAME_UNCHANGED
+from core.batcher import DynamicBatcher
+from core.detections import ClassTable, Detections
+from core.model_backends import export_model, load_model
+from core.model_scheduler import MODEL_NAMES, ModelScheduler
 
+# Placeholder for frames a model did not run on; dropped before concatenation.
+_NO_BOXES = torch.zeros((0, 6))
 
-def run_inference(frame_queue: Queue, results_queue: Queue):
+# Models loaded by the parent before forking the inference workers, shared copy-on-write.
+_preloaded_models = None
+
+
+def run_inference(mailboxes: dict, results_queue: Queue, frame_buffers: dict, num_threads: int = None):
     """
     A target function for the inference process, handling three separate models.
     This is a temporary prototype setup. The ideal solution is a single unified model.
-    """
-    print("[Inference Engine] 🟢 Starting...")
-    print(f"[Inference Engine] Loading Person model: {config.PERSON_MODEL_PATH}")
-    person_model = YOLO(config.PERSON_MODEL_PATH)
 
-    print(f"[Inference Engine] Loading PPE model: {config.PPE_MODEL_PATH}")
-    ppe_model = YOLO(config.PPE_MODEL_PATH)
+    Batches are collected round-robin from the per-camera mailboxes so that every
+    camera gets a fair share of each batch, with a DynamicBatcher choosing the
+    batch size and wait deadline from the measured model latency and load.
+    Frames are read in place from the per-camera shared-memory ring buffers; only
+    the frame handle is forwarded to the logic engine, which releases the slot.
+    Depending on MODEL_EXECUTION_MODE the three models run one after another or
+    concurrently on the same batch.
+
+    Each model runs at its own rate, input size and confidence threshold as set in
+    MODEL_POLICIES. The models skipped on a frame are listed in the result's
+    "skipped_models", so that the logic engine can carry their last detections
+    forward.
 
-    print(f"[Inference Engine] Loading Fire model: {config.FIRE_MODEL_PATH}")
-    fire_model = YOLO(config.FIRE_MODEL_PATH)
+    Each frame's detections are sent as one columnar Detections record together
+    with the frame's sequence number and shape. Frames with persons, detected on
+    the frame or, when the person model was skipped on it, carried forward by the
+    logic engine from the camera's last person model run, also carry their frame
+    handle, so that the logic engine can crop faces and release the slot
+    afterwards; all other frames are released here and sent with
+    `"frame_handle": None`, so no pixels are held for them. The
+    class-id -> name table is sent once, before any results, as
+    `{"class_names": [...], "model_classes": {model: [first_id, end_id]}}`.
 
+    END_OF_STREAM and FRAME_UNCHANGED markers skip the models and are forwarded
+    to the logic engine in order with the camera's frames. Runs forever: a camera
+    whose stream ended can be fed again by its next input handler.
+
+    Several of these processes can run side by side, each owning a fixed subset of
+    the cameras (see start_inference_workers). `num_threads` is this worker's
+    share of the CPU threads; all of INFERENCE_THREADS when omitted.
+    """
+    print("[Inference Engine] 🟢 Starting...")
     device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    person_model.to(device)
-    ppe_model.to(device)
-    fire_model.to(device)
-    print(f"[Inference Engine] ✅ All models loaded successfully on device: {device.upper()}.")
+    executor = configure_model_execution(device, num_threads=num_threads)
+    if _preloaded_models is not None:
+        print("[Inference Engine] ✅ Using models preloaded by the parent process.")
+        person_model, ppe_model, fire_model = _preloaded_models
+    else:
+        person_model, ppe_model, fire_model = load_models(device, num_threads=model_call_threads(num_threads))
+    if config.MODEL_WARMUP:
+        warmup_models(person_model, ppe_model, fire_model)
+    class_table = ClassTable.from_models((person_model, ppe_model, fire_model), MODEL_NAMES)
+    results_queue.put({"class_names": class_table.names, "model_classes": class_table.model_classes})
 
+    batcher = DynamicBatcher(mailboxes, is_frame=_is_frame)
+    scheduler = ModelScheduler()
+    cameras_with_persons = set()  # cameras whose last person model run found someone
     while True:
-        frames_batch = []
-        camera_ids_batch = []
+        batcher.maybe_log()
+        batch_items = batcher.next_batch()
+        if not batch_items:
+            continue
+
+        frame_items = [(camera_id, payload) for camera_id, payload in batch_items if _is_frame(payload)]
+        frames_batch = [frame_buffers[camera_id].view(payload) for camera_id, payload in frame_items]
 
-        while len(frames_batch) < config.INFERENCE_BATCH_SIZE:
+        detections_batch = None
+        if frames_batch:
+            print(f"[Inference Engine] [DEBUG] Collected a batch of {len(frames_batch)} frames.")
+            evaluate = scheduler.plan([camera_id for camera_id, _ in frame_items])
+            skipped_models = iter([[name for name in MODEL_NAMES if not evaluate[name][i]]
+                                   for i in range(len(frames_batch))])
             try:
-                camera_id, frame = frame_queue.get(timeout=0.01)
-                frames_batch.append(frame)
-                camera_ids_batch.append(camera_id)
-            except Exception:
-                break
-
-        if not frames_batch:
-            time.sleep(0.01)
+                start_time = time.time()
+                detections_batch = iter(run_models(person_model, ppe_model, fire_model, frames_batch, executor,
+                                                   evaluate))
+                batcher.record_latency(len(frames_batch), time.time() - start_time)
+                print(f"[Inference Engine] [DEBUG] Finished prediction on batch.")
+            except Exception as e:
+                print(f"[Inference Engine] 🔴 ERROR during model prediction: {e}")
+
+        # Forward results and markers in arrival order so each camera's stream stays ordered.
+        for camera_id, payload in batch_items:
+            if payload == END_OF_STREAM:
+                results_queue.put({"camera_id": camera_id, "end_of_stream": True})
+                scheduler.reset(camera_id)
+                cameras_with_persons.discard(camera_id)
+                print(f"[Inference Engine] 🏁 Camera {camera_id} reached end of stream.")
+            elif payload == FRAME_UNCHANGED:
+                results_queue.put({"camera_id": camera_id, "unchanged": True})
+            elif detections_batch is None:
+                frame_buffers[camera_id].release(payload)
+            else:
+                all_detections = next(detections_batch)
+                frame_skipped_models = next(skipped_models)
+                if "person" not in frame_skipped_models:
+                    if class_table.is_person[all_detections.class_ids].any():
+                        cameras_with_persons.add(camera_id)
+                    else:
+                        cameras_with_persons.discard(camera_id)
+                frame_handle = payload
+                if camera_id not in cameras_with_persons:
+                    # Nobody to recognize, found now or carried forward: no one will read these pixels again.
+                    frame_buffers[camera_id].release(payload)
+                    frame_handle = None
+                output_data = {
+                    "camera_id": camera_id,
+                    "seq": payload.seq,
+                    "frame_shape": payload.shape[:2],
+                    "frame_handle": frame_handle,
+                    "detections": all_detections,
+                    "skipped_models": frame_skipped_models
+                }
+                results_queue.put(output_data)
+                if all_detections:
+                    print(f"[Inference Engine] [DEBUG] Queued {len(all_detections)} detections for camera {camera_id}.")
+
+
+def _is_frame(payload) -> bool:
+    return payload != END_OF_STREAM and payload != FRAME_UNCHANGED
+
+
+def load_models(device: str, backend: str = config.MODEL_BACKEND, num_threads: int = None):
+    """
+    Loads the person, PPE and fire models with the given backend (see MODEL_BACKEND).
+
+    `num_threads` limits the intra-op threads of each exported model's runtime
+    session, which torch.set_num_threads does not reach.
+    """
+    print(f"[Inference Engine] Loading Person model: {config.PERSON_MODEL_PATH} ({backend})")
+    person_model = load_model(config.PERSON_MODEL_PATH, backend, device, num_threads)
+
+    print(f"[Inference Engine] Loading PPE model: {config.PPE_MODEL_PATH} ({backend})")
+    ppe_model = load_model(config.PPE_MODEL_PATH, backend, device, num_threads)
+
+    print(f"[Inference Engine] Loading Fire model: {config.FIRE_MODEL_PATH} ({backend})")
+    fire_model = load_model(config.FIRE_MODEL_PATH, backend, device, num_threads)
+
+    print(f"[Inference Engine] ✅ All models loaded successfully on device: {device.upper()}.")
+    return person_model, ppe_model, fire_model
+
+
+def warmup_models(person_model, ppe_model, fire_model):
+    """
+    Runs each model once on a blank frame at the input sizes it will be used with,
+    so that lazy initialization (graph compilation, memory allocation) happens
+    before the first real frame instead of delaying it.
+    """
+    start_time = time.time()
+    policies = config.MODEL_POLICIES
+    blank_frame = np.zeros((policies["person"]["imgsz"], policies["person"]["imgsz"], 3), dtype=np.uint8)
+    for model, name in zip((person_model, ppe_model, fire_model), MODEL_NAMES):
+        _predict_boxes(model, [blank_frame], [True], policies[name])
+    if config.PPE_CASCADE_MODE == "crops":
+        _predict_boxes(ppe_model, [blank_frame], [True], policies["ppe"], imgsz=config.PPE_CROP_IMGSZ)
+    print(f"[Inference Engine] 🔥 Models warmed up in {time.time() - start_time:.1f}s.")
+
+
+def inference_worker_for(camera_id: int, num_workers: int) -> int:
+    """The inference worker that owns a camera. Fixed, so a camera's frames stay ordered."""
+    return camera_id % num_workers
+
+
+def start_inference_workers(mailboxes: dict, results_queue: Queue, frame_buffers: dict,
+                            num_workers: int = config.INFERENCE_WORKERS):
+    """
+    Starts up to `num_workers` inference processes that split the cameras between them.
+
+    Every camera is owned by exactly one worker (inference_worker_for), so its
+    frames are batched and forwarded by a single process and reach the logic
+    engine in order. The CPU thread budget is divided between the workers, and
+    within a worker between its concurrent model calls; this limits both torch
+    and the runtime sessions of exported backends (see load_models). On CPU
+    with the "fork" start method the weights are loaded and fused once here and
+    inherited copy-on-write by every worker instead of being loaded by each of them. With
+    an exported backend the artifacts are exported here, once, and every worker
+    loads its own runtime session from the cache.
+
+    Returns:
+        list: The started Process objects.
+    """
+    global _preloaded_models
+    if config.MODEL_BACKEND != "pytorch":
+        for weights_path in (config.PERSON_MODEL_PATH, config.PPE_MODEL_PATH, config.FIRE_MODEL_PATH):
+            export_model(weights_path, config.MODEL_BACKEND)
+    elif _preloaded_models is None and get_start_method() == "fork" and not torch.cuda.is_available():
+        _preloaded_models = load_models('cpu')
+        # Ultralytics fuses conv+bn on a model's first predict(), which would allocate new weights in every
+        # worker; fused here, the workers find them fused and keep sharing the parent's pages.
+        for model in _preloaded_models:
+            model.model.fuse(verbose=False)
+
+    total_threads = config.INFERENCE_THREADS or os.cpu_count() or 1
+    processes = []
+    for worker_id in range(num_workers):
+        worker_mailboxes = {camera_id: mailbox for camera_id, mailbox in mailboxes.items()
+                            if inference_worker_for(camera_id, num_workers) == worker_id}
+        if not worker_mailboxes:
             continue
-        print(f"[Inference Engine] [DEBUG] Collected a batch of {len(frames_batch)} frames.")
-        try:
-            person_results = person_model.predict(source=frames_batch, classes=[0], conf=config.CONF_THRESHOLD,
-                                                  verbose=False)
-            ppe_results = ppe_model.predict(source=frames_batch, conf=config.CONF_THRESHOLD, verbose=False)
-            fire_results = fire_model.predict(source=frames_batch, conf=config.CONF_THRESHOLD, verbose=False)
-            print(f"[Inference Engine] [DEBUG] Finished prediction on batch.")
-
-        except Exception as e:
-            print(f"[Inference Engine] 🔴 ERROR during model prediction: {e}")
+        process = Process(
+            target=run_inference,
+            args=(worker_mailboxes, results_queue, frame_buffers, max(1, total_threads // num_workers)),
+            name=f"InferenceEngine-{worker_id}"
+        )
+        process.start()
+        processes.append(process)
+    return processes
+
+
+def configure_model_execution(device: str, mode: str = config.MODEL_EXECUTION_MODE, num_threads: int = None):
+    """
+    Sets the intra-op thread budget for the execution mode and returns the executor to use.
+
+    In "parallel" mode the models run on their own threads (PyTorch releases the
+    GIL inside its kernels) and each concurrent model call gets an equal share of
+    the CPU threads, so they do not oversubscribe the cores. With the PPE cascade
+    on, the PPE model waits for the person model, so at most two calls (person
+    and fire, then PPE and fire) overlap and the threads are split two ways
+    rather than three. In "sequential" mode each model call uses all threads.
+    The thread count is `num_threads`, or INFERENCE_THREADS (every core when 0)
+    when omitted.
+
+    Returns:
+        ThreadPoolExecutor or None: The executor for run_models, None when sequential.
+    """
+    if device == 'cpu':
+        torch.set_num_threads(model_call_threads(num_threads, mode))
+    if mode == "parallel":
+        return ThreadPoolExecutor(max_workers=3, thread_name_prefix="ModelRunner")
+    return None
+
+
+def model_call_threads(num_threads: int = None, mode: str = config.MODEL_EXECUTION_MODE) -> int:
+    """
+    The CPU threads of one model call: `num_threads`, or INFERENCE_THREADS (every
+    core when 0), split between the calls run_models has running at once.
+    """
+    total_threads = num_threads or config.INFERENCE_THREADS or os.cpu_count() or 1
+    return max(1, total_threads // concurrent_model_calls(mode))
+
+
+def concurrent_model_calls(mode: str = config.MODEL_EXECUTION_MODE) -> int:
+    """The most model calls run_models has running at once in the given execution mode."""
+    if mode != "parallel":
+        return 1
+    return 3 if config.PPE_CASCADE_MODE == "off" else 2
+
+
+def run_models(person_model, ppe_model, fire_model, frames_batch, executor: ThreadPoolExecutor = None,
+               evaluate: dict = None):
+    """
+    Runs the three models on one batch and returns the Detections of each frame.
+
+    With an executor the models run concurrently and their results are joined
+    per frame; without one they run one after another. Unless PPE_CASCADE_MODE
+    is "off", the PPE model waits for the person model and only runs where
+    persons were found (see _predict_ppe_cascade). The box tensors of the three
+    models are concatenated per frame, with class ids shifted to their global
+    ids, and copied to the host in a single transfer.
+
+    Args:
+        evaluate (dict): model name -> list of bools telling on which frames the
+            model runs (see ModelScheduler). Every model runs on every frame when omitted.
+    """
+    if evaluate is None:
+        evaluate = {name: [True] * len(frames_batch) for name in MODEL_NAMES}
+    policies = config.MODEL_POLICIES
+    submit = executor.submit if executor is not None else _run_now
+    person_future = submit(_predict_boxes, person_model, frames_batch, evaluate["person"], policies["person"],
+                           classes=[0])
+    fire_future = submit(_predict_boxes, fire_model, frames_batch, evaluate["fire"], policies["fire"])
+    if config.PPE_CASCADE_MODE == "off":
+        ppe_future = submit(_predict_boxes, ppe_model, frames_batch, evaluate["ppe"], policies["ppe"])
+        person_boxes = person_future.result()
+        ppe_boxes = ppe_future.result()
+    else:
+        person_boxes = person_future.result()
+        ppe_boxes = _predict_ppe_cascade(ppe_model, frames_batch, person_boxes, evaluate["ppe"])
+    fire_boxes = fire_future.result()
+
+    all_boxes = (person_boxes, ppe_boxes, fire_boxes)
+    class_offsets = ClassTable.offsets_for((person_model, ppe_model, fire_model))
+
+    detections_batch = []
+    for i in range(len(frames_batch)):
+        frame_boxes = []
+        for model_boxes, class_offset in zip(all_boxes, class_offsets):
+            boxes = model_boxes[i]
+            if not len(boxes):
+                continue
+            if class_offset:
+                boxes = boxes.clone()
+                boxes[:, 5] += class_offset
+            frame_boxes.append(boxes)
+        if frame_boxes:
+            detections_batch.append(Detections(torch.cat(frame_boxes).float().cpu().numpy()))
+        else:
+            detections_batch.append(Detections())
+    return detections_batch
+
+
+def _run_now(fn, *args, **kwargs) -> Future:
+    """Runs a call synchronously and wraps its result like an executor would."""
+    future = Future()
+    future.set_result(fn(*args, **kwargs))
+    return future
+
+
+def _predict_boxes(model, frames, mask, policy: dict, **kwargs):
+    """
+    Runs a model on the frames selected by `mask`, with the input size and
+    confidence threshold of its policy.
+
+    Returns:
+        list: One (N, 6) tensor per frame whose rows are [x1, y1, x2, y2, score,
+            class_id], the Detections layout. Frames that were not selected get
+            an empty tensor.
+    """
+    boxes_per_frame = [_NO_BOXES] * len(frames)
+    frame_indices = [i for i, selected in enumerate(mask) if selected]
+    if not frame_indices:
+        return boxes_per_frame
+    kwargs.setdefault("imgsz", policy["imgsz"])
+    results = model.predict(source=[frames[i] for i in frame_indices], conf=policy["conf"], verbose=False,
+                            **kwargs)
+    for i, result in zip(frame_indices, results):
+        boxes_per_frame[i] = result.boxes.data
+    return boxes_per_frame
+
+
+def _predict_ppe_cascade(ppe_model, frames_batch, person_boxes, mask):
+    """
+    Runs the PPE model only where the person model found someone.
+
+    In "skip_empty" mode the PPE model runs on the full frames that contain at
+    least one person. In "crops" mode it runs on every person box, padded by
+    PPE_CROP_PADDING and batched at the smaller PPE_CROP_IMGSZ input size; the
+    boxes are shifted back to frame coordinates and duplicates from overlapping
+    crops are merged with class-aware NMS. Frames not selected by `mask` are skipped.
+    """
+    policy = config.MODEL_POLICIES["ppe"]
+    has_persons = [selected and len(boxes) > 0 for selected, boxes in zip(mask, person_boxes)]
+    if config.PPE_CASCADE_MODE == "skip_empty":
+        return _predict_boxes(ppe_model, frames_batch, has_persons, policy)
+
+    ppe_boxes = [_NO_BOXES] * len(frames_batch)
+    crops, crop_frames, crop_origins = [], [], []
+    for i, boxes in enumerate(person_boxes):
+        if not has_persons[i]:
             continue
-        for i in range(len(frames_batch)):
-            camera_id = camera_ids_batch[i]
-
-            all_detections = []
-            for box in person_results[i].boxes:
-                all_detections.append({
-                    "bbox": box.xyxy[0].cpu().numpy(), "score": box.conf[0].cpu().numpy(),
-                    "class_name": person_model.names[int(box.cls[0])]
-                })
-            for box in ppe_results[i].boxes:
-                all_detections.append({
-                    "bbox": box.xyxy[0].cpu().numpy(), "score": box.conf[0].cpu().numpy(),
-                    "class_name": ppe_model.names[int(box.cls[0])]
-                })
-            for box in fire_results[i].boxes:
-                all_detections.append({
-                    "bbox": box.xyxy[0].cpu().numpy(), "score": box.conf[0].cpu().numpy(),
-                    "class_name": fire_model.names[int(box.cls[0])]
-                })
-
-            output_data = {
-                "camera_id": camera_id,
-                "original_frame": frames_batch[i],
-                "detections": all_detections
-            }
-            results_queue.put(output_data)
-            if all_detections:
-                print(f"[Inference Engine] [DEBUG] Queued {len(all_detections)} detections for camera {camera_id}.")
+        frame_h, frame_w = frames_batch[i].shape[:2]
+        for x1, y1, x2, y2 in boxes[:, :4].tolist():
+            pad_x, pad_y = (x2 - x1) * config.PPE_CROP_PADDING, (y2 - y1) * config.PPE_CROP_PADDING
+            cx1, cy1 = max(0, int(x1 - pad_x)), max(0, int(y1 - pad_y))
+            cx2, cy2 = min(frame_w, int(x2 + pad_x)), min(frame_h, int(y2 + pad_y))
+            if cx2 > cx1 and cy2 > cy1:
+                crops.append(frames_batch[i][cy1:cy2, cx1:cx2])
+                crop_frames.append(i)
+                crop_origins.append((cx1, cy1))
+    if not crops:
+        return ppe_boxes
+
+    boxes_per_frame = defaultdict(list)
+    crop_boxes = _predict_boxes(ppe_model, crops, [True] * len(crops), policy, imgsz=config.PPE_CROP_IMGSZ)
+    for boxes, i, (origin_x, origin_y) in zip(crop_boxes, crop_frames, crop_origins):
+        if len(boxes):
+            boxes = boxes.clone()
+            boxes[:, [0, 2]] += origin_x
+            boxes[:, [1, 3]] += origin_y
+            boxes_per_frame[i].append(boxes)
+    for i, parts in boxes_per_frame.items():
+        merged = torch.cat(parts)
+        keep = batched_nms(merged[:, :4], merged[:, 4], merged[:, 5].long(), config.PPE_CROP_MERGE_IOU)
+        ppe_boxes[i] = merged[keep]
+    return ppe_boxes
@@ -1,24 +1,109 @@
 import cv2
+import math
+import sys
 import time
-from multiprocessing import Queue
+from queue import Full
+import config
+from core.frame_buffer import FrameRingBuffer
+from core.mailbox import CameraMailbox
+from core.motion_gate import MotionGate
 
+# Put into a camera's mailbox once a finite source is exhausted. The inference
+# engine forwards it to the logic engine in order.
+END_OF_STREAM = "end_of_stream"
+# Put into a camera's mailbox instead of a frame handle when the motion gate
+# suppresses a sampled frame.
+FRAME_UNCHANGED = "unchanged"
 
-def capture_frames(camera_id: int, source_path: str, frame_queue: Queue, target_fps: int):
+
+class CaptureStats:
+    """Counts decoded frames versus frames that were skipped without being decoded."""
+
+    def __init__(self, camera_id: int):
+        self.camera_id = camera_id
+        self.decoded = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.seeks = 0
+        self.gated = 0
+        self._last_log_time = time.time()
+
+    def maybe_log(self, force: bool = False):
+        now = time.time()
+        if force or now - self._last_log_time >= config.STATS_LOG_INTERVAL_SECONDS:
+            self._last_log_time = now
+            print(f"[Input Handler {self.camera_id}] 📊 decoded={self.decoded} skipped={self.skipped} "
+                  f"dropped={self.dropped} seeks={self.seeks} gated={self.gated}")
+
+
+def _read_frame(cap: cv2.VideoCapture, decode: bool, stats: CaptureStats):
+    """
+    Advances the capture by one frame, decoding it only when `decode` is True.
+
+    In "grab" sampling mode a frame that is not needed is only grabbed, which
+    skips the expensive decode step. In "read" mode every frame is decoded.
+
+    Returns:
+        tuple: (ok, frame) where frame is None when the frame was not decoded.
+    """
+    if config.FRAME_SAMPLING_MODE == "read":
+        ret, frame = cap.read()
+        if not ret:
+            return False, None
+        stats.decoded += 1
+        return True, frame if decode else None
+
+    if not cap.grab():
+        return False, None
+    if not decode:
+        stats.skipped += 1
+        return True, None
+    ret, frame = cap.retrieve()
+    if not ret:
+        return False, None
+    stats.decoded += 1
+    return True, frame
+
+
+def capture_frames(camera_id: int, source_path: str, mailbox: CameraMailbox, frame_buffer: FrameRingBuffer,
+                   target_fps: int):
     """
     A target function for a process that continuously reads frames from a video source.
 
-    This function is designed to run in its own process for each camera feed. It reads
-    frames, resizes them for consistency, and puts them into a shared queue for the
-    inference engine to process.
+    This function is designed to run in its own process for each camera feed. It
+    advances through every frame of the source at the source's own rate, but only
+    decodes the frames sampled for analysis (about `target_fps` per second). Decoded
+    frames are written into the camera's shared-memory ring buffer (resized if they
+    exceed the slot size) and only the small frame handle is put into the camera's
+    mailbox. The newest frame wins: when the mailbox is full, or every buffer slot
+    is taken, the oldest pending frame is dropped. Frames suppressed by the motion
+    gate are sent as FRAME_UNCHANGED markers instead. A marker never takes the
+    place of a real frame: it is only queued when the mailbox has room, and
+    nothing is evicted for a frame until the gate has admitted it.
 
     Args:
         camera_id (int): A unique identifier for this camera feed (e.g., 0, 1, 2).
         source_path (str): The path to the video file or the camera stream URL.
-        frame_queue (Queue): The shared multiprocessing queue to send frames to.
+        mailbox (CameraMailbox): This camera's mailbox for the inference engine.
+        frame_buffer (FrameRingBuffer): The shared-memory slots this camera writes frames into.
         target_fps (int): The desired frames per second to process from the video.
     """
     print(f"[Input Handler {camera_id}] 🟢 Starting...")
-    frame_delay = 1 / target_fps
+    stats = CaptureStats(camera_id)
+    motion_gate = MotionGate() if config.MOTION_GATE_ENABLED else None
+    seq = 0
+
+    def release_evicted(item):
+        stats.dropped += 1
+        if item != FRAME_UNCHANGED:
+            frame_buffer.release(item)
+
+    def make_room() -> bool:
+        """Evicts pending items, oldest first, until a slot is free. Markers hold no slot."""
+        while frame_buffer.free_slot_count() == 0:
+            if not mailbox.evict_oldest(release_evicted):
+                return False
+        return True
 
     while True:
         cap = cv2.VideoCapture(source_path)
@@ -29,22 +114,188 @@ def capture_frames(camera_id: int, source_path: str, frame_queue: Queue, target_
             continue
 
         print(f"[Input Handler {camera_id}] ✅ Video source opened successfully.")
+        source_fps = cap.get(cv2.CAP_PROP_FPS) or target_fps
+        frame_period = 1 / source_fps
+        frame_stride = max(1.0, source_fps / target_fps)
+        next_sample_index = 0.0
+        frame_index = 0
+        next_frame_time = time.time()
 
         while True:
-            start_time = time.time()
+            is_sample = frame_index >= next_sample_index
+            if is_sample:
+                next_sample_index += frame_stride
+            # Decode only if the frame can be stored (a slot is free or a pending frame can give up
+            # its own) or might be gated, which needs no slot.
+            decode = is_sample and (motion_gate is not None or frame_buffer.free_slot_count() > 0
+                                    or not mailbox.empty())
 
-            ret, frame = cap.read()
+            ret, frame = _read_frame(cap, decode, stats)
             if not ret:
                 print(f"[Input Handler {camera_id}] 🔄 Video ended. Re-opening...")
                 break
+            if is_sample and not decode:
+                stats.dropped += 1
+
+            if frame is not None and motion_gate is not None and not motion_gate.admit(frame):
+                stats.gated += 1
+                try:
+                    # A placeholder never evicts a pending frame; pending items already stand for this one.
+                    mailbox.put(FRAME_UNCHANGED, block=False)
+                except Full:
+                    pass
+            elif frame is not None:
+                # Make room by dropping the oldest pending frame; it is older than this one.
+                handle = frame_buffer.write(camera_id, seq, frame) if make_room() else None
+                if handle is not None:
+                    seq += 1
+                    mailbox.put_latest(handle, release_evicted)
+                else:
+                    stats.dropped += 1
+            frame_index += 1
+            stats.maybe_log()
 
-            try:
-                frame_queue.put((camera_id, frame), block=False)
-            except Exception as e:
-                pass
-            elapsed_time = time.time() - start_time
-            sleep_time = frame_delay - elapsed_time
+            # Live streams block in grab() at their own rate; files are paced to real time.
+            next_frame_time += frame_period
+            sleep_time = next_frame_time - time.time()
             if sleep_time > 0:
                 time.sleep(sleep_time)
+            elif sleep_time < -1:
+                next_frame_time = time.time()
         cap.release()
 
+
+# How long one bounded wait for a frame slot or mailbox space lasts before the stop event is checked.
+_DOWNSTREAM_POLL_SECONDS = 0.5
+
+
+class _InputStopped(Exception):
+    """Raised inside process_video_file when waiting on the downstream engines is given up."""
+
+
+def _wait_downstream(attempt, stop_event):
+    """
+    Repeats `attempt`, a bounded wait returning None when it timed out, until it returns a result.
+
+    Raises:
+        _InputStopped: `stop_event` was set, or nothing got through for INPUT_STALL_TIMEOUT_SECONDS.
+    """
+    give_up_time = time.time() + config.INPUT_STALL_TIMEOUT_SECONDS
+    while True:
+        result = attempt()
+        if result is not None:
+            return result
+        if stop_event is not None and stop_event.is_set():
+            raise _InputStopped("stopped")
+        if time.time() >= give_up_time:
+            raise _InputStopped(f"no progress downstream for {config.INPUT_STALL_TIMEOUT_SECONDS}s")
+
+
+def _put_within(mailbox: CameraMailbox, item):
+    """One bounded mailbox put for _wait_downstream: True once queued, None on timeout."""
+    try:
+        mailbox.put(item, timeout=_DOWNSTREAM_POLL_SECONDS)
+        return True
+    except Full:
+        return None
+
+
+def process_video_file(camera_id: int, source_path: str, mailbox: CameraMailbox, frame_buffer: FrameRingBuffer,
+                       target_fps: int, stop_event=None):
+    """
+    A target function for a process that reads a finite video file as fast as possible.
+
+    Unlike capture_frames, this does not throttle to wall-clock time and does not
+    re-open the file when it ends. Frames are sampled by their index so that the
+    analysis rate matches `target_fps` of video time, and nothing is dropped: the
+    process waits for free buffer slots and mailbox space instead. Once the file is
+    exhausted an END_OF_STREAM marker is sent for this camera and the process exits.
+
+    Frames between samples are skipped without decoding. When the gap between two
+    samples is at least SEEK_SAMPLING_MIN_STRIDE frames and the file is seekable,
+    the capture seeks straight to the next sample instead of grabbing every frame.
+    Samples suppressed by the motion gate are sent as FRAME_UNCHANGED markers.
+
+    Waits for slots and mailbox space are bounded, so the process never hangs on
+    dead engines: it exits with an error, without END_OF_STREAM, as soon as
+    `stop_event` is set or once nothing got through for
+    INPUT_STALL_TIMEOUT_SECONDS. A non-zero exit code therefore always means the
+    owner has to end the stream itself.
+
+    Args:
+        camera_id (int): A unique identifier for this camera feed (e.g., 0, 1, 2).
+        source_path (str): The path to the video file.
+        mailbox (CameraMailbox): This camera's mailbox for the inference engine.
+        frame_buffer (FrameRingBuffer): The shared-memory slots this camera writes frames into.
+        target_fps (int): The number of frames to analyze per second of video.
+        stop_event (multiprocessing.Event): Optional; set by the owner to make the process give up.
+    """
+    print(f"[Input Handler {camera_id}] 🟢 Starting in batch mode...")
+    cap = cv2.VideoCapture(source_path)
+    stats = CaptureStats(camera_id)
+    seq = frame_index = 0
+    opened = cap.isOpened()
+    try:
+        if not opened:
+            print(f"[Input Handler {camera_id}] 🔴 ERROR: Could not open video file: {source_path}.")
+        else:
+            seq, frame_index = _analyze_file(camera_id, cap, mailbox, frame_buffer, target_fps, stop_event, stats)
+        cap.release()
+        _wait_downstream(lambda: _put_within(mailbox, END_OF_STREAM), stop_event)
+    except _InputStopped as e:
+        cap.release()
+        print(f"[Input Handler {camera_id}] 🔴 Giving up on {source_path}: {e}.")
+        sys.exit(1)
+    if not opened:
+        return
+    stats.maybe_log(force=True)
+    print(f"[Input Handler {camera_id}] 🏁 Finished {source_path}: analyzed {seq} and gated {stats.gated} of {frame_index} frames.")
+
+
+def _analyze_file(camera_id: int, cap: cv2.VideoCapture, mailbox: CameraMailbox, frame_buffer: FrameRingBuffer,
+                  target_fps: int, stop_event, stats: CaptureStats):
+    """The sampling loop of process_video_file. Returns (frames analyzed, frames read)."""
+    motion_gate = MotionGate() if config.MOTION_GATE_ENABLED else None
+    source_fps = cap.get(cv2.CAP_PROP_FPS) or target_fps
+    frame_stride = max(1.0, source_fps / target_fps)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    can_seek = 0 < config.SEEK_SAMPLING_MIN_STRIDE <= frame_stride and total_frames > 0
+    next_sample_index = 0.0
+    frame_index = 0
+    seq = 0
+
+    while True:
+        if stop_event is not None and stop_event.is_set():
+            raise _InputStopped("stopped")
+        sample_index = math.ceil(next_sample_index)
+        if can_seek and sample_index - frame_index >= config.SEEK_SAMPLING_MIN_STRIDE:
+            sample_index = min(sample_index, total_frames)
+            stats.skipped += sample_index - frame_index
+            frame_index = sample_index
+            if sample_index == total_frames or not cap.set(cv2.CAP_PROP_POS_FRAMES, sample_index):
+                break
+            stats.seeks += 1
+
+        is_sample = frame_index >= next_sample_index
+        ret, frame = _read_frame(cap, is_sample, stats)
+        if not ret:
+            break
+
+        if is_sample:
+            next_sample_index += frame_stride
+            if motion_gate is not None and not motion_gate.admit(frame):
+                stats.gated += 1
+                _wait_downstream(lambda: _put_within(mailbox, FRAME_UNCHANGED), stop_event)
+            else:
+                handle = _wait_downstream(
+                    lambda: frame_buffer.write(camera_id, seq, frame, block=True, timeout=_DOWNSTREAM_POLL_SECONDS),
+                    stop_event)
+                try:
+                    _wait_downstream(lambda: _put_within(mailbox, handle), stop_event)
+                except _InputStopped:
+                    frame_buffer.release(handle)
+                    raise
+                seq += 1
+        frame_index += 1
+        stats.maybe_log()
+    return seq, frame_index
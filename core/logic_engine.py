@@ -1,108 +1,140 @@
 import time
-from multiprocessing import Queue
-from collections import defaultdict
+from multiprocessing import Process, Queue
+from queue import Full
 import numpy as np
-import cv2
-import os
 import config
 from bytetrack.bytetrack_simple import SimpleBYTETracker
-from src.face_recognition.app.detector import detect_faces
-from src.face_recognition.app.embedder import get_embedding
-class FaceRecognizer:
-    def __init__(self, data_dir="data"):
-        """
-        Initializes the face recognizer by loading embeddings and names from .npy files.
-        """
-        print("[Face Recognizer] Initializing...")
-        self.known_embeddings = None
-        self.known_names = None
-        embeddings_file = config.FACE_EMBEDDINGS_PATH
-        names_file = config.FACE_NAMES_PATH
-
-        if os.path.exists(embeddings_file) and os.path.exists(names_file):
-            try:
-                self.known_embeddings = np.load(embeddings_file)
-                self.known_names = np.load(names_file, allow_pickle=True)
-
-                if self.known_embeddings.shape[0] == self.known_names.shape[0]:
-                    print(f"[Face Recognizer] ✅ Loaded {len(self.known_names)} face embeddings and names.")
-                else:
-                    print("[Face Recognizer] 🔴 ERROR: Mismatch between embeddings and names file sizes.")
-                    self.known_embeddings = None
-                    self.known_names = None
-            except Exception as e:
-                print(f"[Face Recognizer] 🔴 ERROR loading files: {e}")
-        else:
-            print(f"[Face Recognizer] 🔴 ERROR: One or more files not found.")
-            print(f"  - Searched for embeddings at: {embeddings_file}")
-            print(f"  - Searched for names at: {names_file}")
+from core.detections import ClassTable, Detections
+from core.environmental_events import EnvironmentalEventTracker
+from core.face_worker import FaceRecognitionClient
+from core.ppe_association import PPEAssociator
+from core.track_states import TrackStateStore
 
-    def _cosine_similarity(self, a, b):
-        """Helper function to calculate cosine similarity."""
-        return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
-    def _find_match(self, embedding_to_check):
-        """Finds the best match for a given embedding using cosine similarity."""
-        best_match_name = "Unknown"
-        highest_similarity = 0.0
-        potential_name = "Unknown"
+def process_logic(results_queue: Queue, alert_queue: Queue, frame_buffers: dict, notify_end_of_stream: bool = False,
+                  face_requests: Queue = None, face_replies: Queue = None, face_reply_to: int = 0,
+                  class_table_message: dict = None):
+    """
+    A target function for a logic process: tracking, face recognition, PPE
+    violation checks and alert cooldowns for the cameras whose results arrive on
+    `results_queue` (all cameras, or one shard of them; see start_logic_workers).
 
-        for i, known_emb in enumerate(self.known_embeddings):
-            similarity = self._cosine_similarity(embedding_to_check, known_emb)
-            if similarity > highest_similarity:
-                highest_similarity = similarity
-                potential_name = self.known_names[i]
+    Face recognition runs in the worker pool of core.face_worker, off this
+    loop: crops of "Unknown" tracks are sent on `face_requests` (at most one
+    request in flight per track) and the names arriving on `face_replies` are
+    applied to the tracks' states. `face_reply_to` is the index of
+    `face_replies` among the pool's reply queues.
 
-        print(
-            f"[Face Recognizer] [DEBUG] Best similarity: {highest_similarity:.2f} | Threshold: {config.FACE_RECOGNITION_THRESHOLD}")
+    A result marked "unchanged" (a frame suppressed by the motion gate) reuses the
+    previous detections of that camera, so tracks and violation counters keep
+    advancing as if the same frame had been seen again; only face recognition,
+    which needs pixels, is skipped. An end-of-stream result drops the tracker and
+    cached detections of that camera; the process itself runs forever.
+    With `notify_end_of_stream` a `{"camera_id", "end_of_stream": True}` message
+    follows the camera's last alert on the alert queue, so a consumer knows when
+    the camera is done.
 
-        if highest_similarity > config.FACE_RECOGNITION_THRESHOLD:
-            best_match_name = potential_name
+    Detections arrive as columnar Detections records and are split into persons,
+    PPE items and environmental hazards with the boolean masks of the ClassTable
+    the inference engine sends before its first result (or that is passed as
+    `class_table_message` when a crashed logic process is restarted after it was
+    sent; see ShardedResultsQueue.class_table_messages). Models the inference
+    engine skipped on a frame (see MODEL_POLICIES) contribute their detections
+    from the last frame they ran on, so e.g. fire alerts continue between fire
+    model evaluations exactly as before. The PPE violations of all tracked
+    persons are computed together by a PPEAssociator.
 
-        return best_match_name
+    With several inference workers every camera still has a single producer, so
+    its results arrive in order; as a safeguard a frame whose sequence number is
+    not newer than the last one handled for its camera is dropped.
 
-    def recognize(self, person_crop_image):
-        """
-        Detects a face and finds the closest match from known embeddings.
-        """
-        if self.known_embeddings is None or person_crop_image is None or person_crop_image.size == 0:
-            return "Unknown"
+    Pixels are only read for face recognition of tracks still "Unknown": the
+    result carries a reference to the frame in the camera's shared buffer, and
+    the frame is mapped when the first such track needs a crop. Frames without
+    person detections arrive with no frame reference at all, because the
+    inference engine has already released them.
 
-        try:
-            faces = detect_faces(person_crop_image)
-            if faces:
-                face_image, _ = faces[0]
-                embedding = get_embedding(face_image)
-                name = self._find_match(embedding)
-                return name
-        except Exception:
-            pass
+    Person states (name, violation counter, alert cooldowns) live in a
+    TrackStateStore keyed by (camera_id, track_id): they are dropped when the
+    camera's tracker removes the track or the camera's stream ends, and the
+    store never holds more than MAX_TRACK_STATES of them.
 
-        return "Unknown"
-def check_overlap(person_bbox, item_bbox):
-    px1, py1, px2, py2 = person_bbox
-    ix1, iy1, ix2, iy2 = item_bbox
-    return not (px2 < ix1 or px1 > ix2 or py2 < iy1 or py1 > iy2)
-def process_logic(results_queue: Queue, alert_queue: Queue):
+    Fire and smoke boxes go through an EnvironmentalEventTracker, which merges
+    them into incidents, confirms them over several frames and sends one
+    open/update/close sequence of environmental alerts per incident instead of
+    an alert per box and frame. Only frames the fire model actually ran on count
+    towards confirming an incident; carried-forward boxes do not.
+    """
     print("[Logic Engine] 🟢 Starting...")
 
     trackers = {}
-    tracked_person_states = defaultdict(lambda: {
-        "name": "Unknown",
-        "last_alert_times": defaultdict(float),
-        "violation_confirm_counter": 0,
-        "current_violations": set()
-    })
-
-    face_recognizer = FaceRecognizer()
+    class_table = None
+    ppe_associator = None
     REQUIRED_PPE = {"helmet", "vest"}
+    if class_table_message is not None:
+        class_table = ClassTable(class_table_message["class_names"], class_table_message["model_classes"])
+        ppe_associator = PPEAssociator(class_table, REQUIRED_PPE)
+    last_detections = {}
+    last_frame_shapes = {}
+    last_seqs = {}
+    track_states = TrackStateStore()
+    environmental_events = EnvironmentalEventTracker()
+
+    face_client = FaceRecognitionClient(face_requests, face_replies, face_reply_to)
 
     while True:
+        frame_handle, original_frame = None, None
         try:
+            face_client.maybe_log()
+            track_states.maybe_log()
+            for reply_camera_id, track_id, name in face_client.poll():
+                state = track_states.get(reply_camera_id, track_id)
+                if name != "Unknown" and state is not None:
+                    state.name = name
+                    print(f"[Logic Engine] Identified Track ID {track_id} on camera {reply_camera_id} as '{name}'")
             data = results_queue.get(timeout=1)
-            camera_id, original_frame, all_detections = data["camera_id"], data["original_frame"], data["detections"]
+            if "class_names" in data:
+                class_table = ClassTable(data["class_names"], data["model_classes"])
+                ppe_associator = PPEAssociator(class_table, REQUIRED_PPE)
+                continue
+            if data.get("end_of_stream"):
+                tracker = trackers.pop(data["camera_id"], None)
+                face_client.forget_camera(data["camera_id"])
+                track_states.drop_camera(data["camera_id"])
+                if tracker is not None:
+                    print(f"[Logic Engine] 📊 Camera {data['camera_id']} tracker counters: {tracker.counters}")
+                last_detections.pop(data["camera_id"], None)
+                last_frame_shapes.pop(data["camera_id"], None)
+                last_seqs.pop(data["camera_id"], None)
+                for event in environmental_events.close_camera(data["camera_id"]):
+                    alert_queue.put(event)
+                if notify_end_of_stream:
+                    alert_queue.put({"camera_id": data["camera_id"], "end_of_stream": True})
+                print(f"[Logic Engine] 🏁 Camera {data['camera_id']} reached end of stream.")
+                print(f"[Logic Engine] 📊 Environmental incidents: {environmental_events.counters}")
+                continue
+            camera_id = data["camera_id"]
+            if data.get("unchanged"):
+                if camera_id not in last_detections:
+                    continue
+                all_detections = last_detections[camera_id]
+                frame_shape = last_frame_shapes[camera_id]
+            else:
+                frame_handle, all_detections = data["frame_handle"], data["detections"]
+                if data["seq"] <= last_seqs.get(camera_id, -1):
+                    print(f"[Logic Engine] ⚠️ Dropping out-of-order frame {data['seq']} of camera {camera_id}.")
+                    continue
+                last_seqs[camera_id] = data["seq"]
+                if data["skipped_models"] and camera_id in last_detections:
+                    previous = last_detections[camera_id]
+                    carried = previous.select(class_table.model_mask(data["skipped_models"])[previous.class_ids])
+                    all_detections = Detections(np.concatenate([all_detections.data, carried.data]))
+                frame_shape = data["frame_shape"]
+                last_detections[camera_id] = all_detections
+                last_frame_shapes[camera_id] = frame_shape
 
-            all_class_names = [d['class_name'] for d in all_detections]
+            class_ids = all_detections.class_ids
+            all_class_names = [class_table.names[class_id] for class_id in class_ids]
             print(f"[Logic Engine] [DEBUG] Cam {camera_id} received detections: {all_class_names}")
 
             if camera_id not in trackers:
@@ -112,67 +144,125 @@ def process_logic(results_queue: Queue, alert_queue: Queue):
                     match_thresh=config.MATCH_THRESH
                 )
 
-            person_dets_track, ppe_items, env_alerts = [], [], []
-            for det in all_detections:
-                if det["class_name"] == "person":
-                    person_dets_track.append(det["bbox"].tolist() + [det["score"]])
-                elif det["class_name"] in ["fire", "smoke"]:
-                    env_alerts.append(det)
-                else:
-                    ppe_items.append(det)
-
-            tracked_persons = trackers[camera_id].update(np.array(person_dets_track), original_frame.shape[:2])
-
-            for person in tracked_persons:
-                track_id, person_bbox = person.track_id, person.bbox
-                state = tracked_person_states[track_id]
+            person_dets_track = all_detections.data[class_table.is_person[class_ids], :5]
+            ppe_items = all_detections.select(class_table.is_ppe[class_ids])
+            env_alerts = all_detections.select(class_table.is_environmental[class_ids])
 
-                if state["name"] == "Unknown":
-                    x1, y1, x2, y2 = map(int, person_bbox)
-                    if x1 < x2 and y1 < y2:
-                        name = face_recognizer.recognize(original_frame[y1:y2, x1:x2])
-                        if name != "Unknown":
-                            state["name"] = name
-                            print(f"[Logic Engine] Identified Track ID {track_id} as '{name}'")
+            tracked_persons = trackers[camera_id].update(person_dets_track, frame_shape)
+            removed_track_ids = trackers[camera_id].removed_track_ids.tolist()
+            track_states.drop(camera_id, removed_track_ids)
+            face_client.forget_tracks(camera_id, removed_track_ids)
+            person_violations = ppe_associator.violations(tracked_persons.boxes, ppe_items)
 
-                detected_ppe_for_person, explicit_violations = set(), set()
-                for item in ppe_items:
-                    if check_overlap(person_bbox, item["bbox"]):
-                        if item["class_name"].startswith("no-"):
-                            explicit_violations.add(item["class_name"])
-                        else:
-                            detected_ppe_for_person.add(item["class_name"])
+            for track_id, person_bbox, violations_this_frame in zip(tracked_persons.track_ids.tolist(),
+                                                                    tracked_persons.boxes, person_violations):
+                state = track_states.touch(camera_id, track_id)
 
-                missing_ppe = REQUIRED_PPE - detected_ppe_for_person
-                violations_this_frame = explicit_violations.union({f"missing-{item}" for item in missing_ppe})
+                if state.name == "Unknown" and frame_handle is not None:
+                    head_region = face_client.head_region(camera_id, track_id, person_bbox, frame_shape)
+                    if head_region is not None:
+                        x1, y1, x2, y2 = head_region
+                        if original_frame is None:
+                            original_frame = frame_buffers[camera_id].view(frame_handle)
+                        face_client.submit(camera_id, track_id, original_frame[y1:y2, x1:x2])
 
                 if violations_this_frame:
-                    state["violation_confirm_counter"] = min(config.VIOLATION_CONFIRM_FRAMES,
-                                                             state["violation_confirm_counter"] + 1)
-                    state["current_violations"] = violations_this_frame
+                    state.violation_confirm_counter = min(config.VIOLATION_CONFIRM_FRAMES,
+                                                          state.violation_confirm_counter + 1)
+                    state.current_violations = violations_this_frame
                 else:
-                    state["violation_confirm_counter"] = max(0, state["violation_confirm_counter"] - 1)
-                    if state["violation_confirm_counter"] == 0:
-                        state["current_violations"].clear()
+                    state.violation_confirm_counter = max(0, state.violation_confirm_counter - 1)
+                    if state.violation_confirm_counter == 0:
+                        state.clear_violations()
 
-                if state["violation_confirm_counter"] >= config.VIOLATION_CONFIRM_FRAMES:
+                if state.violation_confirm_counter >= config.VIOLATION_CONFIRM_FRAMES:
                     current_time = time.time()
                     new_alerts_to_send = []
-                    for violation in state["current_violations"]:
-                        if (current_time - state["last_alert_times"][violation]) > config.ALERT_COOLDOWN_SECONDS:
+                    for violation in state.current_violations:
+                        if (current_time - state.last_alert_time(violation)) > config.ALERT_COOLDOWN_SECONDS:
                             new_alerts_to_send.append(violation)
-                            state["last_alert_times"][violation] = current_time
+                            state.record_alert(violation, current_time)
 
                     if new_alerts_to_send:
-                        alert = {"type": "ppe_violation", "camera_id": camera_id, "person_name": state["name"],
+                        alert = {"type": "ppe_violation", "camera_id": camera_id, "person_name": state.name,
                                  "track_id": track_id, "violations": new_alerts_to_send}
                         alert_queue.put(alert)
 
-                    state["violation_confirm_counter"] = 0
+                    state.violation_confirm_counter = 0
 
-            for alert in env_alerts:
-                alert_data = {"type": "environmental_alert", "camera_id": camera_id, "alert_type": alert["class_name"],
-                              "bbox": alert["bbox"].tolist()}
-                alert_queue.put(alert_data)
+            alert_types = [class_table.names[class_id] for class_id in env_alerts.class_ids]
+            fire_evaluated = not data.get("unchanged") and "fire" not in data["skipped_models"]
+            for event in environmental_events.update(camera_id, env_alerts.boxes, env_alerts.scores, alert_types,
+                                                     observed=fire_evaluated):
+                alert_queue.put(event)
         except Exception:
             pass
+        finally:
+            if frame_handle is not None:
+                frame_buffers[frame_handle.camera_id].release(frame_handle)
+
+
+def logic_worker_for(camera_id: int, num_workers: int) -> int:
+    """The logic worker that owns a camera. Fixed, so a camera's tracker and states live in one process."""
+    return camera_id % num_workers
+
+
+class ShardedResultsQueue:
+    """
+    The inference engines' results queue when the logic engine is sharded.
+
+    put() hands each result to the queue of the logic worker owning its camera
+    (logic_worker_for); the class-id table, which every worker needs, goes to all
+    of them. A copy of the table is also kept on `class_table_messages`, for a
+    logic worker restarted after it was sent.
+    """
+
+    def __init__(self, queues: list):
+        self.queues = queues  # one per logic worker; None for a worker without cameras
+        self.class_table_messages = Queue(maxsize=1)
+
+    def put(self, data: dict):
+        if "class_names" in data:
+            try:
+                self.class_table_messages.put_nowait(data)
+            except Full:
+                pass  # every inference worker sends the same table
+            for queue in self.queues:
+                if queue is not None:
+                    queue.put(data)
+        else:
+            self.queues[logic_worker_for(data["camera_id"], len(self.queues))].put(data)
+
+
+def start_logic_workers(camera_ids, alert_queue: Queue, frame_buffers: dict, face_requests: Queue = None,
+                        face_replies: list = None, num_workers: int = config.LOGIC_WORKERS,
+                        notify_end_of_stream: bool = False):
+    """
+    Starts up to `num_workers` logic processes that split the cameras between them.
+
+    Every camera is owned by exactly one worker (logic_worker_for), which keeps
+    its tracker and person states. All workers put their alerts on the same
+    `alert_queue`, so consumers still see one stream. `face_replies` needs one
+    reply queue per worker (start_face_workers(num_reply_queues=num_workers)).
+
+    Returns:
+        tuple: (the results queue to give the inference workers, list of started processes).
+    """
+    queues, processes = [None] * num_workers, []
+    for worker_id in range(num_workers):
+        worker_cameras = [camera_id for camera_id in camera_ids
+                          if logic_worker_for(camera_id, num_workers) == worker_id]
+        if not worker_cameras:
+            continue
+        queues[worker_id] = Queue()
+        process = Process(
+            target=process_logic,
+            args=(queues[worker_id], alert_queue, frame_buffers, notify_end_of_stream),
+            kwargs={"face_requests": face_requests,
+                    "face_replies": face_replies[worker_id] if face_replies else None,
+                    "face_reply_to": worker_id},
+            name=f"LogicEngine-{worker_id}"
+        )
+        process.start()
+        processes.append(process)
+    return ShardedResultsQueue(queues), processes
@@ -0,0 +1,131 @@
+import time
+from multiprocessing import Queue, Value
+from queue import Empty, Full
+
+
+class CameraMailbox:
+    """
+    A small bounded queue holding the pending frames of a single camera.
+
+    Live input handlers use put_latest(), which evicts the oldest pending item
+    when the mailbox is full, so the inference engine always sees the most recent
+    frames and a camera can never hold more than `depth` stale frames. Batch input
+    handlers use the blocking put() so that no frame of an uploaded file is lost.
+
+    `puts` counts every item ever put, evicted or not, so the consumer can
+    measure how fast items arrive independently of how fast it takes them.
+    """
+
+    def __init__(self, depth: int):
+        self.depth = depth
+        self._queue = Queue(maxsize=depth)
+        self._puts = Value("Q", 0)
+
+    @property
+    def puts(self) -> int:
+        return self._puts.value
+
+    def _count_put(self):
+        with self._puts.get_lock():
+            self._puts.value += 1
+
+    def put(self, item, block: bool = True, timeout: float = None):
+        self._queue.put(item, block=block, timeout=timeout)
+        self._count_put()
+
+    def put_latest(self, item, on_evict=None) -> int:
+        """
+        Puts an item without blocking, evicting the oldest items while the mailbox is full.
+
+        Args:
+            item: The item to enqueue.
+            on_evict (callable): Called with every evicted item, e.g. to release its frame slot.
+
+        Returns:
+            int: The number of evicted items.
+        """
+        evicted = 0
+        while True:
+            try:
+                self._queue.put(item, block=False)
+                self._count_put()
+                return evicted
+            except Full:
+                pass
+            if self.evict_oldest(on_evict):
+                evicted += 1
+            else:
+                # Full but nothing readable yet: the consumer is mid-read or the feeder
+                # thread has not flushed. Give it a moment instead of spinning.
+                time.sleep(0.001)
+
+    def evict_oldest(self, on_evict=None) -> bool:
+        """Removes the oldest pending item, if any. Returns True if an item was removed."""
+        try:
+            item = self._queue.get(block=False)
+        except Empty:
+            return False
+        if on_evict is not None:
+            on_evict(item)
+        return True
+
+    def get_nowait(self):
+        return self._queue.get(block=False)
+
+    def qsize(self) -> int:
+        """Approximate number of pending items (0 where the platform cannot tell)."""
+        try:
+            return self._queue.qsize()
+        except NotImplementedError:
+            return 0
+
+    def empty(self) -> bool:
+        return self._queue.empty()
+
+    def full(self) -> bool:
+        return self._queue.full()
+
+
+def collect_round_robin(mailboxes: dict, max_frames: int, start: int = 0, is_frame=None):
+    """
+    Collects up to `max_frames` frames from the mailboxes, one item per camera per round.
+
+    Rounds continue until the batch is full or a whole round finds every mailbox
+    empty, so when all cameras are busy each one gets an equal share of the batch.
+    Items of one camera keep their order.
+
+    Args:
+        mailboxes (dict): camera_id -> CameraMailbox.
+        max_frames (int): The maximum number of frames in the batch.
+        start (int): Index of the camera to start with; rotate it between calls so
+            that no camera is always served first.
+        is_frame (callable): Tells frames apart from markers that do not count
+            towards `max_frames`. Every item counts when omitted.
+
+    Returns:
+        list: (camera_id, item) tuples in the order they were collected.
+    """
+    camera_ids = list(mailboxes.keys())
+    if not camera_ids:
+        return []
+    offset = start % len(camera_ids)
+    camera_ids = camera_ids[offset:] + camera_ids[:offset]
+
+    batch_items = []
+    frames = 0
+    while frames < max_frames:
+        collected_this_round = False
+        for camera_id in camera_ids:
+            if frames >= max_frames:
+                break
+            try:
+                item = mailboxes[camera_id].get_nowait()
+            except Empty:
+                continue
+            collected_this_round = True
+            batch_items.append((camera_id, item))
+            if is_frame is None or is_frame(item):
+                frames += 1
+        if not collected_this_round:
+            break
+    return batch_items
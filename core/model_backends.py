@@ -0,0 +1,117 @@
+import glob
+import hashlib
+import os
+import shutil
+import numpy as np
+from ultralytics import YOLO
+import config
+
+# backend name -> YOLO export arguments. "pytorch" runs the .pt weights as they are.
+MODEL_BACKENDS = {
+    "pytorch": None,
+    "onnx": {"format": "onnx", "dynamic": True},
+    "openvino": {"format": "openvino", "dynamic": True},
+    "openvino-int8": {"format": "openvino", "dynamic": True, "int8": True},
+}
+
+
+def weights_hash(weights_path: str) -> str:
+    """Short SHA-256 of a weights file, used to key its exported artifacts."""
+    digest = hashlib.sha256()
+    with open(weights_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def export_model(weights_path: str, backend: str, cache_dir: str = config.MODEL_EXPORT_CACHE_DIR) -> str:
+    """
+    Returns the path of the `backend` artifact of a .pt model, exporting it first
+    if the cache has none for these exact weights.
+
+    Artifacts are stored under `cache_dir/<name>-<weights hash>/<backend>/`, so
+    retrained weights get a fresh export while unchanged ones are reused across
+    runs. Exports are dynamic in batch and input size, so the per-model input
+    sizes of MODEL_POLICIES and the PPE crop size all work with one artifact.
+    """
+    if backend not in MODEL_BACKENDS:
+        raise ValueError(f"Unknown model backend '{backend}'. Choose one of {list(MODEL_BACKENDS)}.")
+    if MODEL_BACKENDS[backend] is None:
+        return weights_path
+
+    model = None
+    if not os.path.exists(weights_path):
+        # Stock weights such as yolov8n.pt are downloaded on first load.
+        model = YOLO(weights_path)
+        weights_path = str(model.ckpt_path)
+
+    name = os.path.splitext(os.path.basename(weights_path))[0]
+    artifact_dir = os.path.join(cache_dir, f"{name}-{weights_hash(weights_path)}", backend)
+    if os.path.isdir(artifact_dir) and os.listdir(artifact_dir):
+        return os.path.join(artifact_dir, os.listdir(artifact_dir)[0])
+
+    print(f"[Model Backends] Exporting {weights_path} to {backend}...")
+    export_args = dict(MODEL_BACKENDS[backend])
+    if export_args.get("int8") and config.MODEL_INT8_CALIBRATION_DATA:
+        export_args["data"] = config.MODEL_INT8_CALIBRATION_DATA
+    model = model or YOLO(weights_path)
+    exported_path = str(model.export(**export_args)).rstrip(os.sep)
+
+    # Move the export next to its siblings under a temporary name first, so that a
+    # concurrent reader never sees a half-written artifact directory.
+    staging_dir = f"{artifact_dir}.tmp-{os.getpid()}"
+    os.makedirs(staging_dir, exist_ok=True)
+    shutil.move(exported_path, os.path.join(staging_dir, os.path.basename(exported_path)))
+    try:
+        os.replace(staging_dir, artifact_dir)
+    except OSError:
+        # Another process finished the same export first; keep its artifact.
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    print(f"[Model Backends] ✅ Cached {backend} artifact in {artifact_dir}")
+    return os.path.join(artifact_dir, os.listdir(artifact_dir)[0])
+
+
+def load_model(weights_path: str, backend: str = config.MODEL_BACKEND, device: str = 'cpu', num_threads: int = None):
+    """
+    Loads a model for the given backend. Exported models keep the YOLO predict()
+    API and class names, so the inference engine does not care which one it gets.
+
+    ONNX Runtime and OpenVINO ignore torch.set_num_threads and use every core by
+    default; with `num_threads` their session is limited to that many intra-op
+    threads (see limit_runtime_threads).
+    """
+    artifact_path = export_model(weights_path, backend)
+    model = YOLO(artifact_path, task="detect")
+    if backend == "pytorch":
+        model.to(device)
+    elif num_threads:
+        limit_runtime_threads(model, artifact_path, backend, num_threads)
+    return model
+
+
+def limit_runtime_threads(model, artifact_path: str, backend: str, num_threads: int):
+    """
+    Recreates the runtime session of an exported model with `num_threads` intra-op threads.
+
+    Ultralytics creates the session on the first predict() and offers no thread
+    setting, so the model is run once on a small blank image and its session is
+    then replaced by one with the limit. Later predict() calls keep using it.
+    """
+    model.predict(source=np.zeros((32, 32, 3), dtype=np.uint8), imgsz=32, verbose=False)
+    runtime = model.predictor.model
+    if MODEL_BACKENDS[backend]["format"] == "onnx":
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        runtime.session = onnxruntime.InferenceSession(artifact_path, sess_options=options,
+                                                       providers=runtime.session.get_providers())
+    elif MODEL_BACKENDS[backend]["format"] == "openvino":
+        import openvino as ov
+        xml_path = artifact_path
+        if os.path.isdir(artifact_path):
+            xml_path = glob.glob(os.path.join(artifact_path, "*.xml"))[0]
+        core = ov.Core()
+        runtime.ov_compiled_model = core.compile_model(core.read_model(xml_path), device_name="CPU",
+                                                       config={"INFERENCE_NUM_THREADS": num_threads,
+                                                               "PERFORMANCE_HINT": "LATENCY"})
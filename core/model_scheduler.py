@@ -0,0 +1,42 @@
+from collections import defaultdict
+import config
+
+# Order in which the models' class ids are laid out in the ClassTable.
+MODEL_NAMES = ("person", "ppe", "fire")
+
+
+class ModelScheduler:
+    """
+    Decides which models run on which frames of a batch, following MODEL_POLICIES.
+
+    Every model has its own rate: it runs on every `every_n_frames`-th frame of
+    each camera. Frames are counted per camera, so the rate is independent of how
+    the cameras are interleaved in batches. When the PPE cascade is on, PPE can only
+    run on frames where the person model runs too.
+    """
+
+    def __init__(self, policies: dict = None):
+        self.policies = policies or config.MODEL_POLICIES
+        self._frame_counters = defaultdict(int)
+
+    def plan(self, camera_ids) -> dict:
+        """
+        Args:
+            camera_ids (list): The camera of each frame in the batch.
+
+        Returns:
+            dict: model name -> list of bools, True where the model runs on that frame.
+        """
+        masks = {name: [] for name in MODEL_NAMES}
+        for camera_id in camera_ids:
+            frame_count = self._frame_counters[camera_id]
+            self._frame_counters[camera_id] += 1
+            for name in MODEL_NAMES:
+                masks[name].append(frame_count % self.policies[name]["every_n_frames"] == 0)
+        if config.PPE_CASCADE_MODE != "off":
+            masks["ppe"] = [run_ppe and run_person for run_ppe, run_person in zip(masks["ppe"], masks["person"])]
+        return masks
+
+    def reset(self, camera_id):
+        """Forgets a camera's frame count, e.g. when its stream ended."""
+        self._frame_counters.pop(camera_id, None)
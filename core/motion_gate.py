@@ -0,0 +1,50 @@
+import cv2
+import numpy as np
+import config
+
+
+class MotionGate:
+    """
+    Decides per camera whether a sampled frame is worth sending to the models.
+
+    The frame is shrunk to a small grayscale thumbnail and compared against a
+    running-average background. Frames in which too few pixels changed are
+    suppressed, except that at least one frame every `max_skip_frames` samples is
+    always admitted as a keyframe so that slow changes are eventually re-checked.
+    """
+
+    def __init__(self, width=config.MOTION_GATE_WIDTH, pixel_threshold=config.MOTION_GATE_PIXEL_THRESHOLD,
+                 min_changed_fraction=config.MOTION_GATE_MIN_CHANGED_FRACTION,
+                 max_skip_frames=config.MOTION_GATE_MAX_SKIP_FRAMES, learning_rate=config.MOTION_GATE_LEARNING_RATE):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.min_changed_fraction = min_changed_fraction
+        self.max_skip_frames = max_skip_frames
+        self.learning_rate = learning_rate
+        self._background = None
+        self._skipped_in_a_row = 0
+
+    def _thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        h, w = frame.shape[:2]
+        height = max(1, int(h * self.width / w))
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0).astype(np.float32)
+
+    def admit(self, frame: np.ndarray) -> bool:
+        """Returns True if the frame should go through inference."""
+        thumbnail = self._thumbnail(frame)
+        if self._background is None or self._background.shape != thumbnail.shape:
+            self._background = thumbnail
+            self._skipped_in_a_row = 0
+            return True
+
+        diff = cv2.absdiff(thumbnail, self._background)
+        changed_fraction = np.count_nonzero(diff > self.pixel_threshold) / diff.size
+        cv2.accumulateWeighted(thumbnail, self._background, self.learning_rate)
+
+        if changed_fraction >= self.min_changed_fraction or self._skipped_in_a_row >= self.max_skip_frames:
+            self._skipped_in_a_row = 0
+            return True
+        self._skipped_in_a_row += 1
+        return False
@@ -0,0 +1,66 @@
+import numpy as np
+from core.detections import ClassTable, Detections
+
+
+def overlap_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """
+    (len(a), len(b)) boolean matrix telling which boxes overlap or touch.
+
+    Boxes are [x1, y1, x2, y2] rows. Two boxes overlap unless one lies entirely
+    to the left, right, above or below the other.
+    """
+    a = boxes_a[:, None, :]
+    b = boxes_b[None, :, :]
+    return ~((a[..., 2] < b[..., 0]) | (a[..., 0] > b[..., 2]) | (a[..., 3] < b[..., 1]) | (a[..., 1] > b[..., 3]))
+
+
+class PPEAssociator:
+    """
+    Works out the PPE violations of every person in a frame at once.
+
+    A person violates "no-<item>" when an explicit violation box of that class
+    overlaps them, and "missing-<item>" when no box of a required item does.
+    The classes are mapped once to the columns of a violation matrix: one column
+    per explicit violation class and one per required item. A frame then costs
+    one person x item overlap matrix and one matrix product with the items'
+    one-hot columns, instead of a Python loop over every person and item.
+    """
+
+    def __init__(self, class_table: ClassTable, required_ppe):
+        labels, column_of_class = [], np.full(len(class_table.names), -1, dtype=np.int64)
+        for class_id in np.flatnonzero(class_table.is_ppe & class_table.is_violation):
+            label = class_table.names[class_id]
+            if label not in labels:
+                labels.append(label)
+            column_of_class[class_id] = labels.index(label)
+        self.first_required_column = len(labels)
+        for item in sorted(required_ppe):
+            labels.append(f"missing-{item}")
+            for class_id, name in enumerate(class_table.names):
+                if name == item and class_table.is_ppe[class_id]:
+                    column_of_class[class_id] = len(labels) - 1
+        self.labels = labels
+        self.column_of_class = column_of_class
+
+    def violations(self, person_boxes: np.ndarray, ppe_items: Detections) -> list:
+        """
+        Args:
+            person_boxes (np.ndarray): (P, 4) boxes of the tracked persons.
+            ppe_items (Detections): The frame's PPE detections.
+
+        Returns:
+            list: One set of violation labels per person, in person order.
+        """
+        if not len(person_boxes):
+            return []
+        item_columns = self.column_of_class[ppe_items.class_ids]
+        relevant = item_columns >= 0
+        columns_hit = np.zeros((len(person_boxes), len(self.labels)), dtype=bool)
+        if relevant.any():
+            overlaps = overlap_matrix(np.asarray(person_boxes, dtype=np.float32), ppe_items.boxes[relevant])
+            one_hot = np.zeros((int(relevant.sum()), len(self.labels)), dtype=np.float32)
+            one_hot[np.arange(len(one_hot)), item_columns[relevant]] = 1.0
+            columns_hit = (overlaps.astype(np.float32) @ one_hot) > 0
+        # Explicit violations count when hit, required items when not hit.
+        columns_hit[:, self.first_required_column:] = ~columns_hit[:, self.first_required_column:]
+        return [{self.labels[column] for column in np.flatnonzero(row)} for row in columns_hit]
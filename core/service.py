@@ -0,0 +1,300 @@
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict, deque
+from multiprocessing import Event, Process, Queue
+from queue import Empty, Full
+import config
+from core.frame_buffer import create_frame_buffers, destroy_frame_buffers
+from core.face_worker import start_face_workers
+from core.inference_engine import inference_worker_for, start_inference_workers
+from core.input_handler import END_OF_STREAM, process_video_file
+from core.logic_engine import logic_worker_for, start_logic_workers
+from core.mailbox import CameraMailbox
+
+
+class ServiceAtCapacity(RuntimeError):
+    """Raised when a job cannot even be queued because the job queue is full."""
+
+
+class PipelineJob:
+    """One analysis request: its videos, the stream slots they run on and their input processes."""
+
+    def __init__(self, request_id: str, video_paths: list, results_path: str):
+        self.request_id = request_id
+        self.video_paths = video_paths
+        self.results_path = results_path
+        self.slots = []
+        self.input_processes = {}
+        self.open_slots = set()
+        self.status = "queued"
+        self.stop_event = Event()  # tells the job's input handlers to give up
+
+
+class PipelineService:
+    """
+    A long-lived surveillance pipeline shared by all API requests.
+
+    The inference workers, the face-recognition workers and the logic workers are
+    started once, load and warm up their models once, and then run forever over a fixed pool of stream slots.
+    A slot is a camera id with its own mailbox and frame buffer; each video of a
+    job is analyzed by an input handler process writing into one free slot, so
+    frames of all running jobs are batched together by the same inference engine.
+
+    Admission control: a job starts only when there is a free slot for every one
+    of its videos, and jobs start in submission order, either on submit() or when
+    a finishing job frees its slots. Jobs that do not fit wait in a queue of at
+    most `max_queued_jobs`; beyond that submit() raises ServiceAtCapacity.
+
+    Alerts come back tagged with the slot's camera id. A router thread rewrites
+    the camera id to the video's index within its job, appends the alert to the
+    job's results file, and frees the slot when the logic engine reports the end
+    of its stream.
+
+    The router thread also watches the worker processes. A dead one is restarted
+    with the same arguments. Frames it held are lost, so the jobs on the slots it
+    served are stopped and reported "failed". Their streams are ended as usual,
+    with an END_OF_STREAM sent again if none came back within
+    INPUT_STALL_TIMEOUT_SECONDS. The slots are then reset and reused.
+    """
+
+    def __init__(self, results_dir: str, num_slots: int = config.SERVICE_STREAM_SLOTS,
+                 max_queued_jobs: int = config.SERVICE_MAX_QUEUED_JOBS):
+        self.results_dir = results_dir
+        self.num_slots = num_slots
+        self.max_queued_jobs = max_queued_jobs
+        self.alert_queue = Queue()
+        self.frame_buffers = create_frame_buffers(range(num_slots), config.FRAME_BUFFER_SLOTS,
+                                                  config.FRAME_SLOT_SHAPE)
+        self.mailboxes = {slot: CameraMailbox(config.CAMERA_MAILBOX_DEPTH) for slot in range(num_slots)}
+        self.core_processes = []
+        self._free_slots = deque(range(num_slots))
+        self._slot_jobs = {}
+        self._pending_jobs = deque()
+        self._jobs = {}  # queued and running jobs; finished ones are dropped
+        self._failed_jobs = OrderedDict()  # request ids of the last SERVICE_FAILED_JOBS_KEPT failed jobs
+        self._end_of_stream_deadlines = {}  # slot of a failed job -> when to send END_OF_STREAM again
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._router = threading.Thread(target=self._route_alerts, name="AlertRouter", daemon=True)
+        self._results_queue = None
+        self._class_table_message = None  # for restarted logic workers
+        self._closing_slots = []  # slots of crashed input handlers whose END_OF_STREAM did not fit yet
+
+    def start(self):
+        """Starts the face workers, the logic workers, the inference workers and the alert router thread."""
+        print(f"🚀 Starting pipeline service with {self.num_slots} stream slots...")
+        face_requests, face_replies, face_processes = start_face_workers(num_reply_queues=config.LOGIC_WORKERS)
+        results_queue, logic_processes = start_logic_workers(range(self.num_slots), self.alert_queue,
+                                                             self.frame_buffers, face_requests, face_replies,
+                                                             notify_end_of_stream=True)
+        inference_processes = start_inference_workers(self.mailboxes, results_queue, self.frame_buffers)
+        self._results_queue = results_queue
+        self.core_processes = inference_processes + face_processes + logic_processes
+        self._router.start()
+        print("    [Pipeline Service] ✅ Service started.")
+
+    def submit(self, request_id: str, video_paths: list) -> str:
+        """
+        Queues a job. Returns its status, "running" or "queued".
+
+        Raises:
+            ValueError: The job has more videos than the service has stream slots.
+            ServiceAtCapacity: Too many jobs are already waiting.
+        """
+        if len(video_paths) > self.num_slots:
+            raise ValueError(f"A job can have at most {self.num_slots} videos, got {len(video_paths)}.")
+        job = PipelineJob(request_id, video_paths, os.path.join(self.results_dir, f"{request_id}.json"))
+        with self._lock:
+            if len(self._pending_jobs) >= self.max_queued_jobs:
+                raise ServiceAtCapacity(f"{len(self._pending_jobs)} jobs are already waiting.")
+            self._jobs[request_id] = job
+            self._pending_jobs.append(job)
+            self._start_ready_jobs()
+            return job.status
+
+    def job_status(self, request_id: str):
+        """
+        "queued", "running", "finished" or "failed"; None for unknown request ids.
+
+        Only queued and running jobs are kept, plus the ids of recently failed
+        ones; any other request that has a results file has finished.
+        """
+        with self._lock:
+            job = self._jobs.get(request_id)
+            if job is not None:
+                return job.status
+            if request_id in self._failed_jobs:
+                return "failed"
+        return "finished" if os.path.exists(os.path.join(self.results_dir, f"{request_id}.json")) else None
+
+    def stop(self):
+        """Stops all processes and threads and frees the shared frame buffers."""
+        print("🛑 Stopping pipeline service...")
+        self._stopping.set()
+        if self._router.is_alive():
+            self._router.join(timeout=5)
+        for job in self._jobs.values():
+            job.stop_event.set()
+        input_processes = [p for job in self._jobs.values() for p in job.input_processes.values()]
+        for p in input_processes:
+            p.join(timeout=2)
+        for p in input_processes + self.core_processes:
+            if p.is_alive():
+                p.terminate()
+                p.join()
+        destroy_frame_buffers(self.frame_buffers)
+
+    def _start_ready_jobs(self):
+        """Starts queued jobs in order while the next one fits in the free slots. Call with the lock held."""
+        while self._pending_jobs and len(self._pending_jobs[0].video_paths) <= len(self._free_slots):
+            self._start_job(self._pending_jobs.popleft())
+
+    def _start_job(self, job: PipelineJob):
+        for camera_index, source_path in enumerate(job.video_paths):
+            slot = self._free_slots.popleft()
+            self._slot_jobs[slot] = job
+            job.slots.append(slot)
+            job.open_slots.add(slot)
+            input_process = Process(
+                target=process_video_file,
+                args=(slot, source_path, self.mailboxes[slot], self.frame_buffers[slot], config.TARGET_FPS,
+                      job.stop_event),
+                name=f"InputHandler-{job.request_id[:8]}-{camera_index}"
+            )
+            input_process.start()
+            job.input_processes[slot] = input_process
+        job.status = "running"
+        print(f"    [Pipeline Service] Started request {job.request_id} on slots {job.slots}")
+
+    def _recover_failed_inputs(self):
+        """
+        Ends the stream of an input handler that crashed or gave up, so that its slot is not lost.
+        END_OF_STREAM is only queued if the mailbox has room; otherwise it is retried on the next pass.
+        """
+        with self._lock:
+            for slot, job in list(self._slot_jobs.items()):
+                input_process = job.input_processes.get(slot)
+                if input_process is not None and not input_process.is_alive() and input_process.exitcode != 0:
+                    print(f"🔴 WARNING: {input_process.name} stopped without ending its stream; closing it.")
+                    job.input_processes.pop(slot)
+                    self._closing_slots.append(slot)
+                    self._end_of_stream_deadlines.pop(slot, None)
+            now = time.time()
+            for slot, deadline in list(self._end_of_stream_deadlines.items()):
+                if now >= deadline:
+                    # The END_OF_STREAM may have been lost with the crashed worker.
+                    del self._end_of_stream_deadlines[slot]
+                    self._closing_slots.append(slot)
+        closing_slots, self._closing_slots = self._closing_slots, []
+        for slot in closing_slots:
+            try:
+                self.mailboxes[slot].put(END_OF_STREAM, block=False)
+            except Full:
+                self._closing_slots.append(slot)
+
+    def _route_alerts(self):
+        """Writes every alert to its job's results file and frees slots whose stream ended."""
+        while not self._stopping.is_set():
+            self._recover_failed_inputs()
+            self._check_core_processes()
+            try:
+                alert = self.alert_queue.get(timeout=1)
+            except Empty:
+                continue
+            slot = alert["camera_id"]
+            with self._lock:
+                job = self._slot_jobs.get(slot)
+            if job is None:
+                continue
+            if alert.get("end_of_stream"):
+                self._finish_slot(job, slot)
+                continue
+            alert["camera_id"] = job.slots.index(slot)
+            try:
+                with open(job.results_path, 'a') as f:
+                    f.write(json.dumps(alert) + '\n')
+                print(f"📦 Wrote new alert to file for request {job.request_id}")
+            except Exception as e:
+                print(f"🔴 Error writing alert to file: {e}")
+
+    def _finish_slot(self, job: PipelineJob, slot: int):
+        input_process = job.input_processes.get(slot)
+        if input_process is not None:
+            input_process.join(timeout=5)
+        with self._lock:
+            self._slot_jobs.pop(slot, None)
+            job.open_slots.discard(slot)
+            if job.status == "failed":
+                # Everything sent before the END_OF_STREAM has passed; free the frames lost with the crash.
+                self._end_of_stream_deadlines.pop(slot, None)
+                self.frame_buffers[slot].reset()
+            self._free_slots.append(slot)
+            if not job.open_slots:
+                job.input_processes.clear()
+                del self._jobs[job.request_id]
+                if job.status == "failed":
+                    self._failed_jobs[job.request_id] = True
+                    while len(self._failed_jobs) > config.SERVICE_FAILED_JOBS_KEPT:
+                        self._failed_jobs.popitem(last=False)
+                else:
+                    job.status = "finished"
+            self._start_ready_jobs()
+        if not job.open_slots:
+            print(f"✅ Request {job.request_id} {job.status}.")
+            for path in job.video_paths:
+                if os.path.exists(path):
+                    os.remove(path)
+            shutil.rmtree(os.path.join("temp_videos", job.request_id), ignore_errors=True)
+
+    def _check_core_processes(self):
+        """Restarts dead worker processes and fails the jobs on the slots they served."""
+        for i, p in enumerate(self.core_processes):
+            if p.is_alive():
+                continue
+            print(f"🔴 WARNING: Process {p.name} of the pipeline service has terminated unexpectedly; restarting it.")
+            kwargs = {}
+            if p.name.startswith("LogicEngine"):
+                # The inference engine sent the class table only once; if it did, give the new process a copy.
+                if self._class_table_message is None:
+                    try:
+                        self._class_table_message = self._results_queue.class_table_messages.get_nowait()
+                    except Empty:
+                        pass
+                kwargs["class_table_message"] = self._class_table_message
+            self.core_processes[i] = _restarted(p, **kwargs)
+            self._fail_jobs_on(self._slots_served_by(p.name))
+
+    def _slots_served_by(self, process_name: str) -> list:
+        kind, worker_id = process_name.rsplit("-", 1)
+        if kind == "InferenceEngine":
+            return [slot for slot in range(self.num_slots)
+                    if inference_worker_for(slot, config.INFERENCE_WORKERS) == int(worker_id)]
+        if kind == "LogicEngine":
+            return [slot for slot in range(self.num_slots)
+                    if logic_worker_for(slot, config.LOGIC_WORKERS) == int(worker_id)]
+        return []  # face workers hold no frames; their pending requests are retried after a timeout
+
+    def _fail_jobs_on(self, slots):
+        """
+        Stops the running jobs on the given slots and marks them "failed". Their input handlers
+        then exit without END_OF_STREAM, which _recover_failed_inputs sends in their place.
+        """
+        with self._lock:
+            jobs = {self._slot_jobs[slot] for slot in slots if slot in self._slot_jobs}
+            for job in jobs:
+                print(f"🔴 Request {job.request_id} failed: a worker process serving it crashed.")
+                job.status = "failed"
+                job.stop_event.set()
+                for slot in job.open_slots:
+                    self._end_of_stream_deadlines[slot] = time.time() + config.INPUT_STALL_TIMEOUT_SECONDS
+
+
+def _restarted(process: Process, **kwargs) -> Process:
+    """Starts a new process with the target, arguments and name of a dead one; `kwargs` override its keywords."""
+    replacement = Process(target=process._target, args=process._args, kwargs=dict(process._kwargs, **kwargs),
+                          name=process.name)
+    replacement.start()
+    return replacement
@@ -0,0 +1,101 @@
+import sys
+import time
+from collections import OrderedDict
+import config
+
+_NO_VIOLATIONS = frozenset()
+
+
+class PersonState:
+    """What the logic engine remembers about one tracked person."""
+    __slots__ = ("name", "last_alert_times", "violation_confirm_counter", "current_violations")
+
+    def __init__(self):
+        self.name = "Unknown"
+        self.last_alert_times = None  # violation -> time of its last alert, created with the first alert
+        self.violation_confirm_counter = 0
+        self.current_violations = _NO_VIOLATIONS
+
+    def last_alert_time(self, violation) -> float:
+        return 0.0 if self.last_alert_times is None else self.last_alert_times.get(violation, 0.0)
+
+    def record_alert(self, violation, alert_time: float):
+        if self.last_alert_times is None:
+            self.last_alert_times = {}
+        self.last_alert_times[violation] = alert_time
+
+    def clear_violations(self):
+        self.current_violations = _NO_VIOLATIONS
+
+
+class TrackStateStore:
+    """
+    Person states of the logic engine, keyed by (camera_id, track_id).
+
+    A state is created when its track is first reported by the camera's tracker
+    and dropped when the tracker removes the track (see
+    SimpleBYTETracker.removed_track_ids), so a lost track that is re-activated
+    keeps its name and cooldowns, and a dead one frees its state. An ended camera
+    drops all of its states.
+
+    At most `max_states` states are kept (MAX_TRACK_STATES); beyond that the least
+    recently seen state is evicted, so memory stays bounded even if tracks are
+    never reported dead.
+
+    `counters` tracks live and peak states and states created, dropped with
+    their track or camera, and evicted.
+    """
+
+    def __init__(self, max_states: int = config.MAX_TRACK_STATES):
+        self.max_states = max_states
+        self._states = OrderedDict()  # least recently seen first
+        self.counters = {"live": 0, "peak": 0, "created": 0, "dropped": 0, "evicted": 0}
+        self._last_log_time = time.time()
+
+    def __len__(self):
+        return len(self._states)
+
+    def get(self, camera_id, track_id):
+        """Returns the track's state, or None if it has none."""
+        return self._states.get((camera_id, track_id))
+
+    def touch(self, camera_id, track_id) -> PersonState:
+        """Returns the state of a track reported on this frame, creating it if needed."""
+        key = (camera_id, track_id)
+        state = self._states.get(key)
+        if state is not None:
+            self._states.move_to_end(key)
+            return state
+        if len(self._states) >= self.max_states:
+            self._states.popitem(last=False)
+            self.counters["evicted"] += 1
+        state = self._states[key] = PersonState()
+        self.counters["created"] += 1
+        self.counters["peak"] = max(self.counters["peak"], len(self._states))
+        return state
+
+    def drop(self, camera_id, track_ids):
+        """Drops the states of tracks the camera's tracker removed."""
+        for track_id in track_ids:
+            if self._states.pop((camera_id, track_id), None) is not None:
+                self.counters["dropped"] += 1
+
+    def drop_camera(self, camera_id):
+        """Drops all states of a camera, e.g. when its stream ended."""
+        self.drop(camera_id, [key[1] for key in self._states if key[0] == camera_id])
+
+    def approximate_bytes(self) -> int:
+        """Memory held by the states, their keys and the store's index of them."""
+        total = sys.getsizeof(self._states)
+        for key, state in self._states.items():
+            total += sys.getsizeof(key) + sys.getsizeof(state)
+            if state.last_alert_times is not None:
+                total += sys.getsizeof(state.last_alert_times)
+        return total
+
+    def maybe_log(self, force: bool = False):
+        now = time.time()
+        if force or now - self._last_log_time >= config.STATS_LOG_INTERVAL_SECONDS:
+            self._last_log_time = now
+            self.counters["live"] = len(self._states)
+            print(f"[Logic Engine] 📊 Track states: {self.counters}, ~{self.approximate_bytes() / 1024:.0f} KiB")
@@ -1,104 +1,49 @@
 import os
 import shutil
-import time
 import json
+from contextlib import asynccontextmanager
 from typing import List
-from multiprocessing import Process, Queue
-from fastapi import FastAPI, UploadFile, BackgroundTasks
+from fastapi import FastAPI, UploadFile
 from fastapi.responses import JSONResponse
 import uuid
-from core.input_handler import capture_frames
-from core.inference_engine import run_inference
-from core.logic_engine import process_logic
-import config
+from core.service import PipelineService, ServiceAtCapacity
 
-app = FastAPI(title="Video Surveillance API")
 RESULTS_DIR = "results"
 os.makedirs(RESULTS_DIR, exist_ok=True)
+service = None
 
 
-def run_pipeline(video_paths: List[str], request_id: str):
-    """
-    This function encapsulates the entire surveillance pipeline.
-    It is run as a background process.
-    """
-    print(f"🚀 Starting pipeline for request ID: {request_id} with videos: {video_paths}")
-
-    frame_queue = Queue(maxsize=config.FRAME_QUEUE_SIZE)
-    results_queue = Queue()
-    alert_queue = Queue()
-    camera_feeds = {i: path for i, path in enumerate(video_paths)}
-    input_processes = [
-        Process(
-            target=capture_frames,
-            args=(camera_id, source_path, frame_queue, config.TARGET_FPS),
-            name=f"InputHandler-{camera_id}"
-        )
-        for camera_id, source_path in camera_feeds.items()
-    ]
-    for p in input_processes:
-        p.start()
-        print(f"    [Process Manager] Started Input Handler for Camera {p.name}")
-    inference_process = Process(
-        target=run_inference,
-        args=(frame_queue, results_queue),
-        name="InferenceEngine"
-    )
-    inference_process.start()
-    print("    [Process Manager] Started Inference Engine")
-    logic_process = Process(
-        target=process_logic,
-        args=(results_queue, alert_queue),
-        name="LogicEngine"
-    )
-    logic_process.start()
-    print("    [Process Manager] Started Logic Engine")
-    all_processes = input_processes + [inference_process, logic_process]
-    results_file_path = os.path.join(RESULTS_DIR, f"{request_id}.json")
-
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Starts the shared, pre-warmed pipeline service with the app and stops it on shutdown."""
+    global service
+    service = PipelineService(RESULTS_DIR)
+    service.start()
     try:
-        while any(p.is_alive() for p in all_processes):
-            while not alert_queue.empty():
-                try:
-                    alert = alert_queue.get(timeout=1)
-                    with open(results_file_path, 'a') as f:
-                        f.write(json.dumps(alert) + '\n')
-                    print(f"📦 Wrote new alert to file for request {request_id}")
-                except Exception as e:
-                    print(f"🔴 Error writing alert to file: {e}")
-            time.sleep(1)
-
-    except Exception as e:
-        print(f"🔴 WARNING: Pipeline for request {request_id} encountered an error: {e}")
+        yield
     finally:
-        print(f"🛑 Shutting down all processes for request ID: {request_id}...")
-        for p in all_processes:
-            if p.is_alive():
-                p.terminate()
-                p.join()
-        for path in video_paths:
-            if os.path.exists(path):
-                os.remove(path)
-        shutil.rmtree(os.path.join("temp_videos", request_id), ignore_errors=True)
+        service.stop()
+
 
-        print("✅ System shut down gracefully and temporary files cleaned up.")
+app = FastAPI(title="Video Surveillance API", lifespan=lifespan)
 
 
 @app.post("/analyze_videos/")
 async def analyze_videos(
-        background_tasks: BackgroundTasks,
         files: List[UploadFile]
 ):
     """
-    Receives one or more video files and starts the surveillance pipeline.
-    The videos are saved to a temporary directory and the processing is
-    handled in a background task.
+    Receives one or more video files and submits them to the pipeline service.
+    The videos are saved to a temporary directory and analyzed by the shared
+    service as soon as it has a free stream slot for each of them; until then
+    the job waits in the service's queue.
     """
     if not files:
         return JSONResponse(status_code=400, content={"message": "No files uploaded."})
     request_id = str(uuid.uuid4())
     temp_dir = os.path.join("temp_videos", request_id)
     os.makedirs(temp_dir, exist_ok=True)
+    results_file_path = os.path.join(RESULTS_DIR, f"{request_id}.json")
     video_paths = []
 
     try:
@@ -107,24 +52,37 @@ async def analyze_videos(
             video_paths.append(file_location)
             with open(file_location, "wb") as buffer:
                 shutil.copyfileobj(file.file, buffer)
-        background_tasks.add_task(run_pipeline, video_paths, request_id)
-        with open(os.path.join(RESULTS_DIR, f"{request_id}.json"), 'w') as f:
+        with open(results_file_path, 'w') as f:
             pass
+        status = service.submit(request_id, video_paths)
 
         return JSONResponse(
             status_code=202,
             content={
-                "message": "Video analysis started successfully in the background. Check /results/{request_id} for alerts.",
+                "message": "Video analysis started successfully in the background. Check /results/{request_id} for alerts."
+                if status == "running" else
+                "The service is busy; the analysis is queued and starts when capacity frees up. Check /results/{request_id} for alerts.",
                 "request_id": request_id,
+                "status": status,
                 "video_names": [file.filename for file in files]
             }
         )
 
+    except (ValueError, ServiceAtCapacity) as e:
+        _discard_request(temp_dir, results_file_path)
+        status_code = 400 if isinstance(e, ValueError) else 503
+        return JSONResponse(status_code=status_code, content={"message": str(e)})
     except Exception as e:
-        shutil.rmtree(temp_dir)
+        _discard_request(temp_dir, results_file_path)
         return JSONResponse(status_code=500, content={"message": f"An error occurred: {e}"})
 
 
+def _discard_request(temp_dir: str, results_file_path: str):
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    if os.path.exists(results_file_path):
+        os.remove(results_file_path)
+
+
 @app.get("/results/{request_id}")
 async def get_results(request_id: str):
     """
@@ -141,10 +99,11 @@ async def get_results(request_id: str):
         with open(results_file_path, 'r') as f:
             for line in f:
                 alerts.append(json.loads(line))
+        status = service.job_status(request_id)
         if alerts:
-            return JSONResponse(content={"request_id": request_id, "alerts": alerts})
+            return JSONResponse(content={"request_id": request_id, "status": status, "alerts": alerts})
         else:
-            return JSONResponse(content={"message": "Processing in progress. No new alerts yet."})
+            return JSONResponse(content={"status": status, "message": "Processing in progress. No new alerts yet."})
 
     except Exception as e:
         return JSONResponse(status_code=500, content={"message": f"An error occurred while fetching results: {e}"})
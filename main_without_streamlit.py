@@ -1,9 +1,12 @@
 import time
 from multiprocessing import Process, Queue
 import config
+from core.frame_buffer import create_frame_buffers, destroy_frame_buffers
+from core.mailbox import CameraMailbox
 from core.input_handler import capture_frames
-from core.inference_engine import run_inference
-from core.logic_engine import process_logic
+from core.face_worker import start_face_workers
+from core.inference_engine import start_inference_workers
+from core.logic_engine import start_logic_workers
 
 
 def main():
@@ -12,33 +15,27 @@ def main():
     This is the main entry point of the application.
     """
     print("🚀 Starting Safety Surveillance System...")
-    frame_queue = Queue(maxsize=config.FRAME_QUEUE_SIZE)
-    results_queue = Queue()
     alert_queue = Queue()
+    frame_buffers = create_frame_buffers(config.CAMERA_FEEDS.keys(), config.FRAME_BUFFER_SLOTS,
+                                         config.FRAME_SLOT_SHAPE)
+    mailboxes = {camera_id: CameraMailbox(config.CAMERA_MAILBOX_DEPTH) for camera_id in config.CAMERA_FEEDS}
     input_processes = []
     for camera_id, source_path in config.CAMERA_FEEDS.items():
         input_process = Process(
             target=capture_frames,
-            args=(camera_id, source_path, frame_queue, config.TARGET_FPS),
+            args=(camera_id, source_path, mailboxes[camera_id], frame_buffers[camera_id], config.TARGET_FPS),
             name=f"InputHandler-{camera_id}"
         )
         input_processes.append(input_process)
         input_process.start()
         print(f"   [Process Manager] Started Input Handler for Camera {camera_id}")
-    inference_process = Process(
-        target=run_inference,
-        args=(frame_queue, results_queue),
-        name="InferenceEngine"
-    )
-    inference_process.start()
-    print(f"   [Process Manager] Started Inference Engine")
-    logic_process = Process(
-        target=process_logic,
-        args=(results_queue, alert_queue),
-        name="LogicEngine"
-    )
-    logic_process.start()
-    print(f"   [Process Manager] Started Logic Engine")
+    face_requests, face_replies, face_processes = start_face_workers(num_reply_queues=config.LOGIC_WORKERS)
+    print(f"   [Process Manager] Started {len(face_processes)} Face Recognition worker(s)")
+    results_queue, logic_processes = start_logic_workers(config.CAMERA_FEEDS.keys(), alert_queue, frame_buffers,
+                                                         face_requests, face_replies)
+    print(f"   [Process Manager] Started {len(logic_processes)} Logic Engine worker(s)")
+    inference_processes = start_inference_workers(mailboxes, results_queue, frame_buffers)
+    print(f"   [Process Manager] Started {len(inference_processes)} Inference Engine worker(s)")
 
     print("\n✅ All processes have been started. System is running.")
     print("   Press Ctrl+C in the terminal to stop the system.")
@@ -48,7 +45,7 @@ def main():
             if not alert_queue.empty():
                 alert = alert_queue.get()
                 print(f"🚨 NEW ALERT RECEIVED: {alert}")
-            all_processes = input_processes + [inference_process, logic_process]
+            all_processes = input_processes + inference_processes + face_processes + logic_processes
             for p in all_processes:
                 if not p.is_alive():
                     print(f"🔴 WARNING: Process {p.name} has terminated unexpectedly.")
@@ -57,11 +54,12 @@ def main():
 
     except KeyboardInterrupt:
         print("\n🛑 Shutting down all processes...")
-        all_processes = input_processes + [inference_process, logic_process]
+        all_processes = input_processes + inference_processes + face_processes + logic_processes
         for p in all_processes:
             if p.is_alive():
                 p.terminate()
                 p.join()
+        destroy_frame_buffers(frame_buffers)
         print("✅ System shut down gracefully.")
 
 
@@ -1,25 +1,299 @@
-# import psycopg2
-# import sys
-# import os
-# sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-# from src.face_recognition.config import DB_CONFIG
-#
-# def connect_db():
-#     return psycopg2.connect(**DB_CONFIG)
-#
-# def insert_embedding(name, embedding):
-#     conn = connect_db()
-#     cur = conn.cursor()
-#     cur.execute("INSERT INTO face_embeddings (person_name, embedding) VALUES (%s, %s)", (name, list(embedding)))
-#     conn.commit()
-#     cur.close()
-#     conn.close()
-#
-# def fetch_all_embeddings():
-#     conn = connect_db()
-#     cur = conn.cursor()
-#     cur.execute("SELECT id, person_name, embedding FROM face_embeddings")
-#     results = cur.fetchall()
-#     cur.close()
-#     conn.close()
-#     return results
+"""
+On-disk face gallery: memory-mapped, appendable, hot-reloadable
+All files of a gallery live in one directory:
+
+    manifest.json       version, generation, embedding size and the committed length of each file
+    embeddings-<g>.f32  unit-length float32 embeddings, one row per enrollment, append-only
+    names-<g>.txt       the name of each row, one UTF-8 line per row, append-only
+    removed-<g>.i64     int64 rows removed since generation g (tombstones), append-only
+
+Writers append to the data files and then atomically replace the manifest
+(write to a temporary file + os.replace), which is the commit point: readers
+only ever look at the rows and tombstones the manifest counts, so a half
+written append is invisible, and is cut off by the next writer. Embeddings are
+memory-mapped read-only, so every process matching against the gallery shares
+the same pages. compact() rewrites the live rows into a new generation of
+files. The old generation is left in place for readers that still map it and
+is deleted by the next write (enroll, remove or compact); files a reader still
+holds open on Windows are left for a later write.
+
+Usage (from the repository root):
+    python -m src.face_recognition.app.database info
+    python -m src.face_recognition.app.database import data/embeddings.npy data/n.npy
+    python -m src.face_recognition.app.database enroll "Jane Doe" face1.jpg face2.jpg
+    python -m src.face_recognition.app.database remove "Jane Doe"
+    python -m src.face_recognition.app.database compact
+"""
+
+import argparse
+import json
+import os
+import re
+from contextlib import contextmanager
+
+import numpy as np
+
+from src.face_recognition.app.matcher import normalize
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single writer at a time is up to the operator
+    fcntl = None
+
+
+class GallerySnapshot:
+    """One committed version of a gallery"""
+    __slots__ = ("version", "generation", "embeddings", "names", "removed")
+
+    def __init__(self, version, generation, embeddings, names, removed):
+        self.version = version
+        self.generation = generation  # rows keep their index within a generation
+        self.embeddings = embeddings  # (N, D) read-only float32 memmap, unit-length rows
+        self.names = names  # (N,) name of each row
+        self.removed = removed  # row indices that must not be matched
+
+    def __len__(self):
+        return len(self.names) - len(self.removed)
+
+
+class FaceGallery:
+    """A face gallery directory; see the module docstring for the format"""
+
+    MANIFEST = "manifest.json"
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    @staticmethod
+    def _files(generation):
+        return f"embeddings-{generation}.f32", f"names-{generation}.txt", f"removed-{generation}.i64"
+
+    _GENERATION_FILE = re.compile(r"^(?:embeddings|names|removed)-(\d+)\.(?:f32|txt|i64)$")
+
+    def exists(self):
+        return os.path.exists(self._path(self.MANIFEST))
+
+    def _read_manifest(self):
+        try:
+            with open(self._path(self.MANIFEST), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_manifest(self, manifest):
+        temp_path = self._path(self.MANIFEST + ".tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self._path(self.MANIFEST))
+
+    def version(self):
+        """The committed version, or None when there is no gallery yet"""
+        manifest = self._read_manifest()
+        return None if manifest is None else manifest["version"]
+
+    def load(self):
+        """Maps the current version of the gallery
+
+        Raises:
+            FileNotFoundError: there is no gallery in the directory
+        """
+        for attempt in range(2):
+            manifest = self._read_manifest()
+            if manifest is None:
+                raise FileNotFoundError(f"No face gallery in {self.directory}")
+            try:
+                return self._load(manifest)
+            except FileNotFoundError:
+                # Compacted between reading the manifest and opening its files
+                if attempt:
+                    raise
+
+    def _load(self, manifest):
+        embeddings_file, names_file, removed_file = self._files(manifest["generation"])
+        count, dim = manifest["count"], manifest["dim"]
+        if count:
+            embeddings = np.memmap(self._path(embeddings_file), dtype=np.float32, mode="r", shape=(count, dim))
+        else:
+            embeddings = np.empty((0, dim), dtype=np.float32)
+        with open(self._path(names_file), "rb") as f:
+            names = f.read(manifest["names_bytes"]).decode("utf-8").split("\n")[:count]
+        removed = np.fromfile(self._path(removed_file), dtype=np.int64, count=manifest["removed_count"])
+        return GallerySnapshot(manifest["version"], manifest["generation"], embeddings, np.array(names, dtype=str),
+                               removed)
+
+    @contextmanager
+    def _write_lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(".lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _append(self, name, data):
+        with open(self._path(name), "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _discard_uncommitted(self, manifest):
+        """Cuts off whatever a crashed writer appended after the last commit"""
+        embeddings_file, names_file, removed_file = self._files(manifest["generation"])
+        sizes = {embeddings_file: manifest["count"] * manifest["dim"] * 4,
+                 names_file: manifest["names_bytes"],
+                 removed_file: manifest["removed_count"] * 8}
+        for name, size in sizes.items():
+            with open(self._path(name), "ab") as f:
+                if f.tell() > size:
+                    f.truncate(size)
+
+    def _delete_old_generations(self, manifest):
+        """Deletes the files of every generation before the manifest's, skipping those still in use"""
+        for name in os.listdir(self.directory):
+            match = self._GENERATION_FILE.match(name)
+            if match is None or int(match.group(1)) >= manifest["generation"]:
+                continue
+            try:
+                os.remove(self._path(name))
+            except (FileNotFoundError, PermissionError):
+                # Windows does not delete a file a reader still maps; the next write retries
+                pass
+
+    def enroll(self, names, embeddings):
+        """Appends embeddings with their names, creating the gallery if needed
+
+        Returns:
+            the rows of the new embeddings
+        """
+        names = [str(name) for name in np.atleast_1d(names)]
+        embeddings = normalize(embeddings).reshape(len(names) or 1, -1)
+        if len(embeddings) != len(names):
+            raise ValueError(f"{len(embeddings)} embeddings for {len(names)} names")
+        if any("\n" in name for name in names):
+            raise ValueError("Names must not contain line breaks")
+        with self._write_lock():
+            manifest = self._read_manifest()
+            if manifest is None:
+                manifest = {"version": 0, "generation": 0, "dim": embeddings.shape[1], "count": 0,
+                            "names_bytes": 0, "removed_count": 0}
+            if embeddings.shape[1] != manifest["dim"]:
+                raise ValueError(f"Embeddings have size {embeddings.shape[1]}, the gallery {manifest['dim']}")
+            self._delete_old_generations(manifest)
+            self._discard_uncommitted(manifest)
+            embeddings_file, names_file, _ = self._files(manifest["generation"])
+            names_data = "".join(name + "\n" for name in names).encode("utf-8")
+            self._append(embeddings_file, embeddings.tobytes())
+            self._append(names_file, names_data)
+            rows = np.arange(manifest["count"], manifest["count"] + len(names))
+            manifest["count"] += len(names)
+            manifest["names_bytes"] += len(names_data)
+            manifest["version"] += 1
+            self._write_manifest(manifest)
+        return rows
+
+    def remove(self, name):
+        """Tombstones every row enrolled under the name. Returns the number of rows removed."""
+        with self._write_lock():
+            manifest = self._read_manifest()
+            if manifest is None:
+                return 0
+            self._delete_old_generations(manifest)
+            self._discard_uncommitted(manifest)
+            snapshot = self._load(manifest)
+            live = np.ones(len(snapshot.names), dtype=bool)
+            live[snapshot.removed] = False
+            rows = np.flatnonzero((snapshot.names == name) & live).astype(np.int64)
+            if not len(rows):
+                return 0
+            self._append(self._files(manifest["generation"])[2], rows.tobytes())
+            manifest["removed_count"] += len(rows)
+            manifest["version"] += 1
+            self._write_manifest(manifest)
+        return len(rows)
+
+    def compact(self):
+        """Rewrites the live rows into a new generation of files, dropping the tombstoned ones
+
+        The previous generation's files stay until the next write, as face workers may still map them.
+        """
+        with self._write_lock():
+            manifest = self._read_manifest()
+            if manifest is None:
+                return
+            self._delete_old_generations(manifest)
+            snapshot = self._load(manifest)
+            live = np.ones(len(snapshot.names), dtype=bool)
+            live[snapshot.removed] = False
+            generation = manifest["generation"] + 1
+            embeddings_file, names_file, removed_file = self._files(generation)
+            names_data = "".join(name + "\n" for name in snapshot.names[live]).encode("utf-8")
+            for name, data in ((embeddings_file, np.ascontiguousarray(snapshot.embeddings[live]).tobytes()),
+                               (names_file, names_data), (removed_file, b"")):
+                with open(self._path(name), "wb") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+            del snapshot
+            manifest.update(version=manifest["version"] + 1, generation=generation, count=int(live.sum()),
+                            names_bytes=len(names_data), removed_count=0)
+            self._write_manifest(manifest)
+
+
+def main():
+    import config
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gallery", default=config.FACE_GALLERY_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("info")
+    import_parser = commands.add_parser("import", help="append the rows of an embeddings/names .npy pair")
+    import_parser.add_argument("embeddings")
+    import_parser.add_argument("names")
+    enroll_parser = commands.add_parser("enroll", help="enroll the first face found in each image")
+    enroll_parser.add_argument("name")
+    enroll_parser.add_argument("images", nargs="+")
+    remove_parser = commands.add_parser("remove")
+    remove_parser.add_argument("name")
+    commands.add_parser("compact")
+    args = parser.parse_args()
+
+    gallery = FaceGallery(args.gallery)
+    if args.command == "import":
+        rows = gallery.enroll(np.load(args.names, allow_pickle=True), np.load(args.embeddings))
+        print(f"✅ Imported {len(rows)} embeddings.")
+    elif args.command == "enroll":
+        import cv2
+        from src.face_recognition.app.detector import detect_faces
+        from src.face_recognition.app.embedder import get_embedding
+
+        embeddings = []
+        for image_path in args.images:
+            faces = detect_faces(cv2.imread(image_path))
+            if faces:
+                embeddings.append(get_embedding(faces[0][0]))
+            else:
+                print(f"🔴 No face found in {image_path}")
+        if embeddings:
+            gallery.enroll([args.name] * len(embeddings), np.array(embeddings))
+            print(f"✅ Enrolled {len(embeddings)} embeddings of {args.name}.")
+    elif args.command == "remove":
+        print(f"✅ Removed {gallery.remove(args.name)} embeddings of {args.name}.")
+    elif args.command == "compact":
+        gallery.compact()
+        print("✅ Compacted.")
+
+    if not gallery.exists():
+        print(f"🔴 No face gallery in {args.gallery}")
+        return
+    snapshot = gallery.load()
+    people = len(set(np.delete(snapshot.names, snapshot.removed)))
+    print(f"Gallery {args.gallery}: version {snapshot.version}, {len(snapshot)} embeddings of {people} people, "
+          f"{len(snapshot.removed)} removed rows awaiting compaction.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,234 @@
-# import numpy as np
-# import sys
-# import os
-# sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-# from src.face_recognition.config import THRESHOLD
-#
-# def cosine_similarity(a, b):
-#     a, b = np.array(a), np.array(b)
-#     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
-#
-# def find_match(embedding, db_embeddings):
-#     for db_id, db_name, db_emb in db_embeddings:
-#         sim = cosine_similarity(embedding, db_emb)
-#         if sim > (1 - THRESHOLD):
-#             return True, db_name
-#     return False, None
+"""
+Gallery search for face embeddings
+Exact search is one matrix product against a gallery normalized once at load time.
+For large galleries an optional IVF-PQ index approximates it, NumPy only.
+"""
+
+import numpy as np
+
+
+def normalize(embeddings):
+    """Scales each row (or a single vector) to unit length, as float32"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def _nearest_centroids(data, centroids):
+    """Index of the closest centroid (squared L2) of every row of data"""
+    distances = (centroids * centroids).sum(axis=1)[None, :] - 2.0 * (data @ centroids.T)
+    return distances.argmin(axis=1)
+
+
+def kmeans(data, k, iterations=20, rng=None):
+    """Lloyd's k-means; empty clusters are re-seeded from random points
+
+    Returns:
+        (k, D) float32 array of centroids
+    """
+    rng = np.random.default_rng(0) if rng is None else rng
+    data = np.asarray(data, dtype=np.float32)
+    centroids = data[rng.choice(len(data), size=k, replace=len(data) < k)].copy()
+    for _ in range(iterations):
+        assignment = _nearest_centroids(data, centroids)
+        counts = np.bincount(assignment, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, data)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        centroids[~filled] = data[rng.choice(len(data), size=int((~filled).sum()))]
+    return centroids
+
+
+class IVFPQIndex:
+    """Inverted file index with product-quantized residuals, for inner-product search
+
+    The vectors are split into num_lists clusters by a coarse k-means. Each
+    vector is stored in its cluster's list as num_subvectors one-byte codes: the
+    residual to its cluster centroid is cut into num_subvectors chunks and every
+    chunk is replaced by the nearest of num_codes centroids learned for that
+    chunk. A query only scans the num_probes lists whose centroids score highest,
+    and scores their vectors from per-chunk lookup tables instead of the
+    vectors themselves.
+    """
+
+    def __init__(self, num_lists=None, num_subvectors=32, num_codes=256, num_probes=8,
+                 iterations=10, max_training_vectors=16384, seed=0):
+        """
+        Args:
+            num_lists: number of inverted lists, None for about sqrt(number of vectors)
+            num_subvectors: chunks per vector, must divide the vector size
+            num_codes: centroids per chunk, at most 256 so a code fits in a byte
+            num_probes: lists scanned per query
+            iterations: k-means iterations for the coarse and chunk centroids
+            max_training_vectors: k-means trains on a random sample of at most this many vectors
+            seed: seed of the training sample and k-means initialization
+        """
+        if num_codes > 256:
+            raise ValueError("num_codes must be at most 256")
+        self.num_lists = num_lists
+        self.num_subvectors = num_subvectors
+        self.num_codes = num_codes
+        self.num_probes = num_probes
+        self.iterations = iterations
+        self.max_training_vectors = max_training_vectors
+        self.seed = seed
+        self.coarse_centroids = None
+        self.codebooks = None  # (num_subvectors, num_codes, chunk size)
+        self.codes = None  # (N, num_subvectors) uint8, grouped by list
+        self.ids = None  # (N,) original row of each code
+        self.list_offsets = None  # list l holds codes[list_offsets[l]:list_offsets[l + 1]]
+
+    def __len__(self):
+        return 0 if self.ids is None else len(self.ids)
+
+    def build(self, vectors):
+        """Trains the quantizers on the vectors and indexes all of them"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        count, dim = vectors.shape
+        if dim % self.num_subvectors:
+            raise ValueError(f"num_subvectors ({self.num_subvectors}) must divide the vector size ({dim})")
+        rng = np.random.default_rng(self.seed)
+        num_lists = self.num_lists or max(1, int(round(np.sqrt(count))))
+        num_lists = min(num_lists, count)
+        sample = vectors
+        if count > self.max_training_vectors:
+            sample = vectors[rng.choice(count, size=self.max_training_vectors, replace=False)]
+
+        self.coarse_centroids = kmeans(sample, num_lists, self.iterations, rng)
+        sample_residuals = sample - self.coarse_centroids[_nearest_centroids(sample, self.coarse_centroids)]
+        chunks = self._chunks(sample_residuals)
+        num_codes = min(self.num_codes, len(sample))
+        self.codebooks = np.stack([kmeans(chunks[:, m], num_codes, self.iterations, rng)
+                                   for m in range(self.num_subvectors)])
+
+        assignment = _nearest_centroids(vectors, self.coarse_centroids)
+        chunks = self._chunks(vectors - self.coarse_centroids[assignment])
+        codes = np.stack([_nearest_centroids(chunks[:, m], self.codebooks[m])
+                          for m in range(self.num_subvectors)], axis=1).astype(np.uint8)
+        order = np.argsort(assignment, kind="stable")
+        self.codes = codes[order]
+        self.ids = order.astype(np.int64)
+        self.list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=num_lists))])
+        return self
+
+    def _chunks(self, vectors):
+        """(N, D) -> (N, num_subvectors, D / num_subvectors)"""
+        return vectors.reshape(len(vectors), self.num_subvectors, -1)
+
+    def search(self, query, k):
+        """Approximate top-k inner-product search for one query vector
+
+        Returns:
+            ids: row indices of the best vectors found, best first
+            scores: their approximate inner products with the query
+        """
+        query = np.asarray(query, dtype=np.float32).ravel()
+        coarse_scores = self.coarse_centroids @ query
+        num_probes = min(self.num_probes, len(coarse_scores))
+        probed = np.argpartition(-coarse_scores, num_probes - 1)[:num_probes]
+        starts, ends = self.list_offsets[probed], self.list_offsets[probed + 1]
+        lengths = ends - starts
+        if not lengths.sum():
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        # Positions of all codes of the probed lists, each with its list's coarse score
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        base_scores = np.repeat(coarse_scores[probed], lengths)
+
+        lookup = np.einsum("md,mkd->mk", self._chunks(query[None])[0], self.codebooks)
+        scores = base_scores + lookup[np.arange(self.num_subvectors), self.codes[positions]].sum(axis=1)
+        k = min(k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return self.ids[positions[best]], scores[best]
+
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.coarse_centroids, self.codebooks, self.codes, self.ids,
+                                              self.list_offsets) if array is not None)
+
+
+class GalleryMatcher:
+    """Finds the most similar gallery identity for face embeddings by cosine similarity
+
+    The gallery is normalized once, so matching a batch of faces is a single
+    matrix product. With an index, each face is first searched approximately
+    and only the index's best `rerank` candidates, plus any rows enrolled after
+    the index was built, are compared exactly.
+    """
+
+    def __init__(self, embeddings, names, index=None, rerank=32, normalized=False, removed=None, index_rows=None):
+        """
+        Args:
+            embeddings: (N, D) gallery embeddings
+            names: (N,) identity of each embedding
+            index: optional IVFPQIndex, built here over the live rows unless it already is
+            rerank: candidates taken from the index and compared exactly
+            normalized: the embeddings already have unit length and are used as they
+                are, without a copy (e.g. a memory-mapped gallery)
+            removed: indices of rows that must never match
+            index_rows: gallery row of each vector of an already built index, e.g. the
+                index_rows of a matcher over an earlier version of the same gallery;
+                None when the index holds exactly the live rows
+        """
+        self.embeddings = embeddings if normalized else normalize(embeddings).reshape(len(names), -1)
+        self.names = np.asarray(names)
+        self.rerank = rerank
+        self.index = index
+        self._live = np.ones(len(self.names), dtype=bool)
+        if removed is not None:
+            self._live[removed] = False
+        self.live_rows = np.flatnonzero(self._live)
+        self.removed_rows = np.flatnonzero(~self._live)
+        if index is not None and not len(index) and len(self.live_rows):
+            index.build(self.embeddings[self.live_rows] if len(self.removed_rows) else self.embeddings)
+        if index is not None and not len(index):
+            self.index = None
+        self.index_rows = None
+        self.unindexed_rows = np.empty(0, dtype=np.int64)
+        if self.index is not None:
+            self.index_rows = self.live_rows if index_rows is None else np.asarray(index_rows)
+            # Rows appended since the index was built are compared exactly
+            self.unindexed_rows = self.live_rows[self.live_rows > self.index_rows.max()]
+
+    def stale_rows(self):
+        """Rows the index does not describe: live rows it lacks plus indexed rows removed since"""
+        if self.index is None:
+            return 0
+        return len(self.unindexed_rows) + int((~self._live[self.index_rows]).sum())
+
+    def __len__(self):
+        return len(self.live_rows)
+
+    def match(self, embedding):
+        """Returns (name, cosine similarity) of the best gallery match of one embedding"""
+        names, similarities = self.match_batch(np.asarray(embedding)[None])
+        return names[0], float(similarities[0])
+
+    def match_batch(self, embeddings):
+        """Best gallery match of each of the (Q, D) embeddings
+
+        Returns:
+            names: (Q,) best matching names, "Unknown" for an empty gallery
+            similarities: (Q,) their cosine similarities
+        """
+        queries = normalize(embeddings).reshape(-1, self.embeddings.shape[1])
+        if not len(self.live_rows):
+            return np.full(len(queries), "Unknown", dtype=object), np.zeros(len(queries), dtype=np.float32)
+        if self.index is None:
+            similarities = queries @ self.embeddings.T
+            similarities[:, self.removed_rows] = -np.inf
+            best = similarities.argmax(axis=1)
+            return self.names[best], similarities[np.arange(len(queries)), best]
+
+        best = np.empty(len(queries), dtype=np.int64)
+        best_similarities = np.empty(len(queries), dtype=np.float32)
+        for i, query in enumerate(queries):
+            candidates, _ = self.index.search(query, self.rerank)
+            candidates = self.index_rows[candidates]
+            candidates = np.concatenate([candidates[self._live[candidates]], self.unindexed_rows])
+            if not len(candidates):
+                candidates = self.live_rows
+            similarities = self.embeddings[candidates] @ query
+            top = similarities.argmax()
+            best[i], best_similarities[i] = candidates[top], similarities[top]
+        return self.names[best], best_similarities